@@ -1,96 +1,286 @@
-import uuid
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+import base64
+import json
+from bson import ObjectId
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
 from datetime import datetime, timedelta
+from typing import Optional, Tuple, Union
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
+from app.core.config import settings
+from app.core.http_cache import challenge_etags, etag_matches, make_etag, not_modified, set_cache_headers
+from app.core.pubsub import Subscription
+from app.core.singleflight import SingleFlight
 from app.db.database import get_db
-from app.schemas.challenge import ChallengeCreate, Challenge
+from app.schemas.challenge import ChallengeCreate, Challenge, ChallengePage
+from app.api.destinations import build_round
+from app.services.catalog import catalog
+from app.services.known_users import known_users
+from app.services.leaderboard import leaderboard
+from app.services.rooms import RemoteRoom, Room, RoomError, rooms
+from app.services.scores import scores
 import random
 import string
 
 router = APIRouter()
 
+MAX_CODE_ATTEMPTS = 5
+CHALLENGE_CACHE_CONTROL = f"public, max-age={settings.CHALLENGE_CACHE_MAX_AGE_SECONDS}"
+# Fields needed to build the Challenge schema
+HISTORY_PROJECTION = {
+    "challenge_code": 1, "challenger_username": 1, "challenger_score": 1,
+    "to_username": 1, "status": 1, "created_at": 1, "expires_at": 1, "results": 1, "winner": 1
+}
+# A shared challenge link can bring hundreds of identical lookups at once
+challenge_reads = SingleFlight("challenge", settings.READ_COALESCE_TIMEOUT_SECONDS)
+
 def generate_challenge_code(length=6):
     """Generate a random challenge code"""
     return ''.join(random.choices(string.ascii_uppercase + string.digits, k=length))
 
+def challenge_from_doc(challenge_doc: dict) -> Challenge:
+    return Challenge(
+        id=str(challenge_doc["_id"]),
+        challenge_code=challenge_doc["challenge_code"],
+        challenger_username=challenge_doc["challenger_username"],
+        challenger_score=challenge_doc["challenger_score"],
+        to_username=challenge_doc.get("to_username"),
+        status=challenge_doc.get("status", "pending"),
+        created_at=challenge_doc["created_at"],
+        expires_at=challenge_doc.get("expires_at"),
+        results=challenge_doc.get("results"),
+        winner=challenge_doc.get("winner")
+    )
+
 @router.post("/", response_model=Challenge)
 async def create_challenge(
     challenge: ChallengeCreate,
     db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Create a new challenge link"""
-    # Check if user exists
-    user = await db["users"].find_one({"username": challenge.challenger_username})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    # The in-memory leaderboard knows every user and their current score;
+    # only users it has not picked up yet need a read
+    score = leaderboard.score(challenge.challenger_username)
+    if score is None:
+        if not known_users.might_exist(challenge.challenger_username):
+            raise HTTPException(status_code=404, detail="User not found")
+        user = await db["users"].find_one({"username": challenge.challenger_username}, {"score": 1})
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        score = scores.overlay({"username": challenge.challenger_username, **user}).get("score", 0)
     
-    # Generate a unique challenge code
-    challenge_code = generate_challenge_code()
-    while await db["challenges"].find_one({"challenge_code": challenge_code}):
-        challenge_code = generate_challenge_code()
-    
-    # Create a new challenge
+    # Store the challenger on the challenge so lookups are a single read
+    now = datetime.now()
     challenge_doc = {
-        "challenger_id": user["_id"],
-        "challenge_code": challenge_code,
-        "created_at": datetime.now(),
-        "score": user.get("score", 0),
+        "challenger_username": challenge.challenger_username,
+        "challenger_score": score,
+        "to_username": challenge.to_username,
+        "created_at": now,
         "status": "pending",
-        "expires_at": datetime.now() + timedelta(days=7)  # Challenge expires in 7 days
+        "expires_at": now + timedelta(days=7),  # Challenge expires in 7 days
+        "version": 0
     }
-    result = await db["challenges"].insert_one(challenge_doc)
-    created_challenge = await db["challenges"].find_one({"_id": result.inserted_id})
+    # Insert optimistically and let the challenge_code_unique index catch collisions
+    for _ in range(MAX_CODE_ATTEMPTS):
+        challenge_doc["challenge_code"] = generate_challenge_code()
+        try:
+            await db["challenges"].insert_one(challenge_doc)
+            break
+        except DuplicateKeyError:
+            challenge_doc.pop("_id", None)
+    else:
+        raise HTTPException(status_code=503, detail="Could not generate a unique challenge code")
     
-    return Challenge(
-        id=str(created_challenge["_id"]),
-        challenge_code=created_challenge["challenge_code"],
-        challenger_username=user["username"],
-        challenger_score=user["score"],
-        status="pending",
-        created_at=created_challenge["created_at"],
-        expires_at=created_challenge["expires_at"]
-    )
+    # insert_one set the _id on challenge_doc, so there is nothing to read back
+    return challenge_from_doc(challenge_doc)
 
 @router.get("/{challenge_code}", response_model=Challenge)
 async def get_challenge(
     challenge_code: str,
+    request: Request,
+    response: Response,
     db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Get challenge details by challenge code"""
-    challenge_doc = await db["challenges"].find_one({"challenge_code": challenge_code})
+    # Revalidations of a recently served challenge are answered from memory
+    cached_etag = challenge_etags.get(challenge_code)
+    if cached_etag and etag_matches(request, cached_etag):
+        return not_modified(cached_etag, CHALLENGE_CACHE_CONTROL)
+    
+    challenge_doc = await challenge_reads.do(
+        challenge_code, lambda: db["challenges"].find_one({"challenge_code": challenge_code})
+    )
     if not challenge_doc:
         raise HTTPException(status_code=404, detail="Challenge not found")
+    challenge_doc = dict(challenge_doc)  # Shared with the other coalesced requests
     
-    # Check if challenge has expired
-    if challenge_doc.get("expires_at") and challenge_doc["expires_at"] < datetime.now():
-        await db["challenges"].update_one(
-            {"_id": challenge_doc["_id"]},
-            {"$set": {"status": "expired"}}
-        )
-        challenge_doc["status"] = "expired"
+    # Report expiry right away; the stored status is updated by the background sweeper
+    etag_ttl = None
+    if challenge_doc.get("status", "pending") == "pending" and challenge_doc.get("expires_at"):
+        remaining = (challenge_doc["expires_at"] - datetime.now()).total_seconds()
+        if remaining <= 0:
+            challenge_doc["status"] = "expired"
+        else:
+            etag_ttl = remaining  # Don't serve 304s for a pending challenge past its expiry
     
-    user = await db["users"].find_one({"_id": challenge_doc["challenger_id"]})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    etag = make_etag(challenge_doc["_id"], challenge_doc.get("version", 0), challenge_doc.get("status", "pending"))
+    challenge_etags.set(challenge_code, etag, etag_ttl)
+    if etag_matches(request, etag):
+        return not_modified(etag, CHALLENGE_CACHE_CONTROL)
     
-    return Challenge(
-        id=str(challenge_doc["_id"]),
-        challenge_code=challenge_doc["challenge_code"],
-        challenger_username=user["username"],
-        challenger_score=user["score"],
-        status="pending",
-        created_at=challenge_doc["created_at"],
-        expires_at=challenge_doc["expires_at"]
+    if "challenger_username" not in challenge_doc:
+        # Challenges created before the challenger was stored on the document
+        user = await db["users"].find_one({"_id": challenge_doc["challenger_id"]})
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        challenge_doc["challenger_username"] = user["username"]
+        challenge_doc["challenger_score"] = user["score"]
+    
+    set_cache_headers(response, etag, CHALLENGE_CACHE_CONTROL)
+    return challenge_from_doc(challenge_doc)
+
+def new_room(challenge_doc: dict) -> Room:
+    """Pick the rounds for a live game on a challenge"""
+    destinations = catalog.sample(rooms.rounds)
+    # Only what a player needs to answer: the id and the alias (a hash of the
+    # name) would identify the destination, and the token unlocks /answer
+    hidden = {"destination_id", "alias", "round_token"}
+    rounds = [build_round(destination).model_dump(exclude=hidden) for destination in destinations]
+    invited = [challenge_doc["challenger_username"]]
+    if challenge_doc.get("to_username"):
+        invited.append(challenge_doc["to_username"])
+    return Room(
+        code=challenge_doc["challenge_code"],
+        challenge_id=challenge_doc["_id"],
+        invited=invited,
+        rounds=rounds,
+        answers=[destination["name"] for destination in destinations],
+        fun_facts=[random.choice(destination.get("fun_facts") or [""]) for destination in destinations]
     )
 
-@router.get("/user/{username}", response_model=list[Challenge])
-async def get_user_challenges(username: str, db: AsyncIOMotorDatabase = Depends(get_db)):
-    cursor = db["challenges"].find({
-        "$or": [
-            {"challenger_username": username},
-            {"to_username": username}
-        ]
-    }).sort("created_at", -1)
+async def forward_room_events(websocket: WebSocket, subscription: Subscription):
+    try:
+        async for message in subscription:
+            await websocket.send_text(message)
+        # The room closed or this connection fell too far behind
+        await websocket.close()
+    except Exception:
+        pass  # The client went away first
+
+async def join_live_room(
+    db: AsyncIOMotorDatabase, challenge_code: str, username: str
+) -> Tuple[Union[Room, RemoteRoom], Subscription]:
+    room = rooms.get(challenge_code)
+    if room is None:
+        challenge_doc = await challenge_reads.do(
+            challenge_code, lambda: db["challenges"].find_one({"challenge_code": challenge_code})
+        )
+        if not challenge_doc or "challenger_username" not in challenge_doc:
+            raise RoomError(4404, "Challenge not found")
+        expires_at = challenge_doc.get("expires_at")
+        if challenge_doc.get("status") == "expired" or (expires_at and expires_at < datetime.now()):
+            raise RoomError(4410, "Challenge expired")
+        # A played challenge stays played; its result may also still be waiting for the next flush
+        if challenge_doc.get("status", "pending") != "pending" or rooms.played(challenge_code):
+            raise RoomError(4410, "Challenge already played")
+        if not len(catalog):
+            raise RoomError(1013, "No destinations found")
+        if not known_users.might_exist(username):
+            raise RoomError(4404, "User not found")
+        holder = await rooms.claim(challenge_code)
+        if holder is None:
+            raise RoomError(1013, "Room is changing workers, try again")
+        if holder != rooms.owner:
+            # Another worker holds the room: play in it through the cache channel
+            return await rooms.join_remote(challenge_code, holder, username)
+        # Another player may have opened the room while the challenge was read
+        room = rooms.open(new_room(challenge_doc))
+    elif not known_users.might_exist(username):
+        raise RoomError(4404, "User not found")
+    return room, rooms.join(room, username)
+
+@router.websocket("/{challenge_code}/live")
+async def live_challenge(
+    websocket: WebSocket,
+    challenge_code: str,
+    username: str = Query(...),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Play a challenge head-to-head in real time.
+
+    Both players get the same rounds in the initial `state` message and send
+    `{"type": "answer", "round": i, "answer": "..."}`. Joins, answers, scores
+    and the final result are pushed to both as they happen.
+    """
+    # Accept first so a refused join can tell the client why in the close code
+    await websocket.accept()
+    try:
+        room, subscription = await join_live_room(db, challenge_code, username)
+    except RoomError as e:
+        await websocket.close(code=e.code, reason=e.reason)
+        return
+
+    sender = asyncio.create_task(forward_room_events(websocket, subscription))
+    try:
+        while True:
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            if frame.get("text") is None:
+                subscription.send({"type": "error", "detail": "Expected a text frame"})
+                continue
+            try:
+                message = json.loads(frame["text"])
+            except ValueError:
+                subscription.send({"type": "error", "detail": "Invalid JSON"})
+                continue
+            if not isinstance(message, dict) or message.get("type") != "answer":
+                subscription.send({"type": "error", "detail": "Unknown message"})
+                continue
+            try:
+                rooms.answer(room, username, subscription, message.get("round"), message.get("answer"))
+            except RoomError as e:
+                subscription.send({"type": "error", "detail": e.reason})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+        rooms.leave(room, username, subscription)
+
+def encode_history_cursor(challenge_doc: dict) -> str:
+    position = {"c": challenge_doc["created_at"].isoformat(), "i": str(challenge_doc["_id"])}
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+def decode_history_cursor(after: str) -> Tuple[datetime, ObjectId]:
+    try:
+        position = json.loads(base64.urlsafe_b64decode(after.encode()))
+        return datetime.fromisoformat(position["c"]), ObjectId(position["i"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+
+@router.get("/user/{username}", response_model=ChallengePage)
+async def get_user_challenges(
+    username: str,
+    limit: int = Query(20, ge=1, le=100),
+    after: Optional[str] = None,
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Challenges sent or received by a user, newest first.
+
+    Uses keyset pagination on (created_at, _id) so every page is an index
+    range scan on the participant indexes, however deep it is.
+    """
+    participants = [{"challenger_username": username}, {"to_username": username}]
+    if after:
+        created_at, last_id = decode_history_cursor(after)
+        keyset = [{"created_at": {"$lt": created_at}}, {"created_at": created_at, "_id": {"$lt": last_id}}]
+        # One flat $or branch per participant field and keyset bound, so each
+        # is a bounded scan of its index and the planner merges them in order
+        query = {"$or": [{**participant, **bound} for participant in participants for bound in keyset]}
+    else:
+        query = {"$or": participants}
     
-    challenges = await cursor.to_list(length=100)
-    return [Challenge(**challenge) for challenge in challenges]
\ No newline at end of file
+    cursor = db["challenges"].find(query, HISTORY_PROJECTION).sort([("created_at", -1), ("_id", -1)]).limit(limit + 1)
+    challenges = await cursor.to_list(length=limit + 1)
+    next_after = encode_history_cursor(challenges[limit - 1]) if len(challenges) > limit else None
+    return ChallengePage(items=[challenge_from_doc(c) for c in challenges[:limit]], next_after=next_after)
@@ -1,6 +1,10 @@
+import json
 import random
-from fastapi import APIRouter, Depends, HTTPException, Header
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 from datetime import datetime
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from app.db.database import get_db
@@ -9,34 +13,26 @@ from app.schemas.destination import (
     DestinationOut, 
     DestinationClue, 
     AnswerVerification, 
-    AnswerResponse
+    AnswerResponse,
+    BulkInsertSummary
 )
 from app.api.users import update_user_score
+from app.core.security import InvalidRoundToken, create_round_token, decode_round_token, round_answer_matches
+from app.services.catalog import catalog
+from app.services.ordinals import assign as assign_ordinals
+from app.services.sampler import sampler
 from bson import ObjectId
 
 
 router = APIRouter()
 
-@router.get("/random", response_model=DestinationClue)
-async def get_random_destination(
-    x_username: Optional[str] = Header(None),
-    db: AsyncIOMotorDatabase = Depends(get_db)
-):
-    total = await db["travel_destinations"].count_documents({})
-    if total == 0:
-        raise HTTPException(status_code=404, detail="No destinations found")
-    
-    random_index = random.randint(0, total - 1)
-    cursor = db["travel_destinations"].find().skip(random_index).limit(1)
-    destination_list = await cursor.to_list(length=1)
-    if not destination_list:
-        raise HTTPException(status_code=404, detail="Destination not found")
-    destination = destination_list[0]
-    
-    # Get three other destinations for multiple choice options
-    cursor = db["travel_destinations"].find({"_id": {"$ne": destination["_id"]}}, {"name": 1}).limit(3)
-    others = await cursor.to_list(length=3)
-    options = [d["name"] for d in others]
+BULK_CHUNK_SIZE = 500  # Destinations validated and inserted per insert_many on the streaming endpoint
+MAX_LINE_BYTES = 1024 * 1024  # Longer NDJSON lines are rejected without being buffered
+MAX_REPORTED_ERRORS = 100
+
+def build_round(destination: dict) -> DestinationClue:
+    """Build a multiple-choice round for a destination from the in-memory catalog"""
+    options = [d["name"] for d in catalog.distractors(destination, 3)]
     options.append(destination["name"])
     random.shuffle(options)
     
@@ -44,28 +40,84 @@ async def get_random_destination(
     num_clues = min(2, len(destination.get("clues", [])))
     selected_clues = random.sample(destination.get("clues", []), num_clues) if destination.get("clues", []) else []
     
+    # Pick the fun fact now so /answer can be checked from the signed token alone
+    fun_facts = destination.get("fun_facts") or []
+    fun_fact_index = random.randrange(len(fun_facts)) if fun_facts else -1
+    destination_id = str(destination["_id"])
+    
     return DestinationClue(
-        destination_id=str(destination["_id"]),
+        destination_id=destination_id,
         alias=destination["alias"],
         clues=selected_clues,
-        options=options
+        options=options,
+        round_token=create_round_token(destination_id, destination["name"], fun_fact_index)
     )
 
-@router.post("/answer", response_model=AnswerResponse)
-async def submit_answer(
-    verification: AnswerVerification,
+async def draw_destinations(db: AsyncIOMotorDatabase, username: Optional[str], k: int) -> List[dict]:
+    """Draw destinations, without repeats until a known user has seen the whole catalog"""
+    if username:
+        return await sampler.draw(db, username, k)
+    return catalog.sample(k)
+
+@router.get("/random", response_model=DestinationClue)
+async def get_random_destination(
+    x_username: Optional[str] = Header(None),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    destination_list = await draw_destinations(db, x_username, 1)
+    if not destination_list:
+        raise HTTPException(status_code=404, detail="No destinations found")
+    return build_round(destination_list[0])
+
+@router.get("/rounds", response_model=List[DestinationClue])
+async def get_rounds(
+    n: int = Query(10, ge=1, le=50),
+    x_username: Optional[str] = Header(None),
     db: AsyncIOMotorDatabase = Depends(get_db)
 ):
+    """Serve up to n non-repeating rounds in one response so a session needs a single request"""
+    destinations = await draw_destinations(db, x_username, n)
+    if not destinations:
+        raise HTTPException(status_code=404, detail="No destinations found")
+    return [build_round(destination) for destination in destinations]
+
+async def find_destination(db: AsyncIOMotorDatabase, destination_id: str) -> dict:
+    """Look a destination up in the catalog, falling back to the database"""
+    destination = catalog.get(destination_id)
+    if destination:
+        return destination
     try:
-        destination_id = ObjectId(verification.destination_id)  # Convert to ObjectId
+        object_id = ObjectId(destination_id)  # Convert to ObjectId
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid destination ID")
-    destination = await db["travel_destinations"].find_one({"_id": destination_id})
+    destination = await db["travel_destinations"].find_one({"_id": object_id})
     if not destination:
         raise HTTPException(status_code=404, detail="Destination not found")
-    
-    is_correct = destination["name"].lower() == verification.user_answer.lower()
-    fun_fact = random.choice(destination.get("fun_facts", []))
+    return destination
+
+@router.post("/answer", response_model=AnswerResponse)
+async def submit_answer(
+    verification: AnswerVerification,
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    if verification.round_token:
+        # New clients: the answer is checked against the signed round token
+        try:
+            claims = decode_round_token(verification.round_token)
+        except InvalidRoundToken as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if claims["d"] != verification.destination_id:
+            raise HTTPException(status_code=400, detail="Round token does not match destination")
+        destination = await find_destination(db, claims["d"])
+        is_correct = round_answer_matches(claims, verification.user_answer)
+        fun_facts = destination.get("fun_facts", [])
+        fun_fact_index = claims.get("f", -1)
+        fun_fact = fun_facts[fun_fact_index] if 0 <= fun_fact_index < len(fun_facts) else ""
+    else:
+        # Old clients only send the destination id
+        destination = await find_destination(db, verification.destination_id)
+        is_correct = destination["name"].lower() == verification.user_answer.lower()
+        fun_fact = random.choice(destination.get("fun_facts", []))
     points_earned = 10 if is_correct else 0
     
     # Update user score if username is provided
@@ -79,6 +131,9 @@ async def submit_answer(
         points_earned=points_earned
     )
 
+def destination_out(doc: dict) -> DestinationOut:
+    return DestinationOut(**{**doc, "_id": str(doc["_id"])})
+
 @router.post("/", response_model=DestinationOut)
 async def create_destination(
     destination: DestinationCreate,
@@ -86,9 +141,10 @@ async def create_destination(
 ):
     destination_doc = destination.model_dump()
     destination_doc["created_at"] = datetime.now()
-    result = await db["travel_destinations"].insert_one(destination_doc)
-    created = await db["travel_destinations"].find_one({"_id": result.inserted_id})
-    return DestinationOut(**created)
+    await assign_ordinals(db, [destination_doc])
+    await db["travel_destinations"].insert_one(destination_doc)  # Sets destination_doc["_id"]
+    catalog.add([destination_doc])
+    return destination_out(destination_doc)
 
 @router.post("/bulk", response_model=List[DestinationOut])
 async def create_destinations_bulk(
@@ -100,7 +156,118 @@ async def create_destinations_bulk(
         doc = d.model_dump()
         doc["created_at"] = datetime.utcnow()
         docs.append(doc)
-    result = await db["travel_destinations"].insert_many(docs)
-    inserted_ids = result.inserted_ids
-    docs = await db["travel_destinations"].find({"_id": {"$in": inserted_ids}}).to_list(length=len(inserted_ids))
-    return [DestinationOut(**doc) for doc in docs]
\ No newline at end of file
+    await assign_ordinals(db, docs)
+    await db["travel_destinations"].insert_many(docs)  # Sets each doc's "_id"
+    catalog.add(docs)
+    return [destination_out(doc) for doc in docs]
+
+class UploadStreamingResponse(StreamingResponse):
+    """Streams a response generated while the request body is still being read.
+
+    StreamingResponse listens for client disconnects by calling receive()
+    alongside the body iterator, which would swallow request body chunks.
+    Here the body iterator is the only reader; a disconnect surfaces as
+    ClientDisconnect from request.stream().
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+
+async def ndjson_lines(request: Request) -> AsyncIterator[Tuple[int, Optional[bytes]]]:
+    """Yield (line number, line) for each non-blank NDJSON line as the body arrives.
+
+    Lines longer than MAX_LINE_BYTES are yielded as None and skipped rather
+    than buffered.
+    """
+    buffer, line_no, skipping = b"", 0, False
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if skipping:
+                skipping = False  # The end of an over-long line
+                continue
+            line_no += 1
+            if line.strip():
+                yield line_no, line
+        if len(buffer) > MAX_LINE_BYTES:
+            if not skipping:
+                line_no += 1
+                skipping = True
+                yield line_no, None
+            buffer = b""
+    if buffer.strip() and not skipping:
+        yield line_no + 1, buffer
+
+async def insert_chunk(db: AsyncIOMotorDatabase, chunk: List[Tuple[int, dict]]) -> List[Dict[str, Any]]:
+    docs = [doc for _, doc in chunk]
+    failed = {}
+    # Ordinals of rejected documents are left unused
+    await assign_ordinals(db, docs)
+    try:
+        await db["travel_destinations"].insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        # Unordered: every document without a write error was inserted
+        failed = {
+            error["index"]: "Duplicate alias" if error.get("code") == 11000 else error.get("errmsg", "Write failed")
+            for error in e.details.get("writeErrors", [])
+        }
+    catalog.add(doc for i, doc in enumerate(docs) if i not in failed)
+    return [
+        {"line": line_no, "error": failed[i]} if i in failed else {"line": line_no, "id": str(doc["_id"])}
+        for i, (line_no, doc) in enumerate(chunk)
+    ]
+
+async def ingest_ndjson(request: Request, db: AsyncIOMotorDatabase) -> AsyncIterator[Dict[str, Any]]:
+    """Validate and insert an NDJSON upload chunk by chunk, yielding a result per line"""
+    chunk = []
+    async for line_no, line in ndjson_lines(request):
+        if line is None:
+            yield {"line": line_no, "error": f"Line longer than {MAX_LINE_BYTES} bytes"}
+            continue
+        try:
+            destination = DestinationCreate.model_validate_json(line)
+        except ValidationError as e:
+            yield {"line": line_no, "error": "; ".join(
+                f"{'.'.join(map(str, error['loc'])) or 'line'}: {error['msg']}" for error in e.errors()
+            )}
+            continue
+        doc = destination.model_dump()
+        doc["created_at"] = datetime.utcnow()
+        chunk.append((line_no, doc))
+        if len(chunk) >= BULK_CHUNK_SIZE:
+            for result in await insert_chunk(db, chunk):
+                yield result
+            chunk = []
+    if chunk:
+        for result in await insert_chunk(db, chunk):
+            yield result
+
+@router.post("/bulk/stream", response_model=BulkInsertSummary)
+async def create_destinations_bulk_stream(
+    request: Request,
+    results: str = Query("summary", pattern="^(summary|stream)$"),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Insert destinations from an NDJSON body (one DestinationCreate per line) as it is uploaded.
+
+    Returns a summary, or with results=stream an NDJSON line per input line
+    ({"line", "id"} or {"line", "error"}) so memory stays flat for any upload size.
+    """
+    if results == "stream":
+        async def result_lines():
+            async for result in ingest_ndjson(request, db):
+                yield json.dumps(result) + "\n"
+        return UploadStreamingResponse(result_lines(), media_type="application/x-ndjson")
+
+    summary = {"received": 0, "inserted": 0, "failed": 0, "inserted_ids": [], "errors": []}
+    async for result in ingest_ndjson(request, db):
+        summary["received"] += 1
+        if "id" in result:
+            summary["inserted"] += 1
+            summary["inserted_ids"].append(result["id"])
+        else:
+            summary["failed"] += 1
+            if len(summary["errors"]) < MAX_REPORTED_ERRORS:
+                summary["errors"].append(result)
+    return summary
\ No newline at end of file
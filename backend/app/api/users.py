@@ -1,33 +1,133 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from datetime import datetime
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+import time
+from app.core.channel import channel
+from app.core.config import settings
+from app.core.http_cache import etag_matches, make_etag, not_modified, set_cache_headers
+from app.core.singleflight import SingleFlight
 from app.db.database import get_db
 from app.schemas.user import UserCreate, UserOut, UserScore, LeaderboardEntry
+from app.services.known_users import known_users
+from app.services.leaderboard import leaderboard
+from app.services.leaderboard_stream import leaderboard_stream
+from app.services.profiles import profiles
+from app.services.scores import scores
 from typing import List
 
 router = APIRouter()
 
+# Profiles change with every answer: let clients keep a copy but always revalidate
+USER_CACHE_CONTROL = "private, no-cache"
+
+profile_reads = SingleFlight("user", settings.READ_COALESCE_TIMEOUT_SECONDS)
+
+async def load_profile(db: AsyncIOMotorDatabase, username: str):
+    """Read a user document and cache it"""
+    read_started = time.monotonic()
+    user = await db["users"].find_one({"username": username})
+    if user:
+        profiles.set(username, user, read_started)
+    return user
+
 @router.post("/auth", response_model=UserOut)
 async def create_user(user: UserCreate, db: AsyncIOMotorDatabase = Depends(get_db)):
-    exists = await db["users"].find_one({"username": user.username})
-    if exists:
-        # If user exists, just return the existing user
-        return UserOut(**exists)
-    
-    user_doc = user.model_dump()
+    # Insert the user if missing and return the stored user either way, in one round trip
+    user_doc = user.model_dump(exclude={"username"})
     user_doc["created_at"] = datetime.now()
     user_doc["score"] = 0
     user_doc["correct_answers"] = 0
     user_doc["incorrect_answers"] = 0
-    result = await db["users"].insert_one(user_doc)
-    new_user = await db["users"].find_one({"_id": result.inserted_id})
-    return UserOut(**new_user)
+    user_doc["version"] = 0
+    user_doc["updated_at"] = user_doc["created_at"]
 
-@router.get("/{username}", response_model=UserOut)
-async def get_user(username: str, db: AsyncIOMotorDatabase = Depends(get_db)):
-    user = await db["users"].find_one({"username": username})
-    if not user:
+    async def upsert():
+        return await db["users"].find_one_and_update(
+            {"username": user.username},
+            {"$setOnInsert": user_doc},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+    read_started = time.monotonic()
+    try:
+        stored = await upsert()
+    except DuplicateKeyError:
+        # A concurrent registration of the same name inserted first; now it matches
+        stored = await upsert()
+    profiles.set(user.username, stored, read_started)
+    stored = scores.overlay(stored)
+    if not known_users.might_exist(user.username):
+        # Most likely a new user: tell the other workers' filters. Anything missed is picked up by their polls.
+        await channel.publish({"type": "user_registered", "username": user.username})
+    known_users.add(user.username)
+    leaderboard.add_user(user.username, stored["score"])
+    return UserOut(**stored)
+
+@router.get("/leaderboard", response_model=List[LeaderboardEntry])
+async def get_leaderboard(
+    offset: int = Query(0, ge=0),
+    limit: int = Query(10, ge=1, le=100)
+):
+    # Served from the in-memory ranking; declared before /{username} so it is not shadowed
+    return [
+        LeaderboardEntry(username=username, score=score, rank=rank)
+        for rank, username, score in leaderboard.range(offset, limit)
+    ]
+
+@router.get("/leaderboard/stream")
+async def stream_leaderboard():
+    """Server-sent events: a `snapshot` of the top entries, then a `diff` of changed ranks whenever they change"""
+    # Subscribe before taking the snapshot so no diff is missed in between
+    subscription = leaderboard_stream.subscribe()
+    snapshot = leaderboard_stream.snapshot()
+
+    async def events():
+        try:
+            yield snapshot
+            async for frame in subscription:
+                yield frame
+        finally:
+            subscription.close()
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # Don't let a proxy hold the events back
+    })
+
+@router.get("/{username}/rank", response_model=LeaderboardEntry)
+async def get_user_rank(username: str):
+    rank = leaderboard.rank(username)
+    if rank is None:
         raise HTTPException(status_code=404, detail="User not found")
+    return LeaderboardEntry(username=username, score=leaderboard.score(username), rank=rank)
+
+@router.get("/{username}", response_model=UserOut)
+async def get_user(
+    username: str,
+    request: Request,
+    response: Response,
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    # Profiles are cached as stored in Mongo; see ProfileCache for how they stay current
+    user = profiles.get(username)
+    if user is None:
+        if not known_users.might_exist(username):
+            raise HTTPException(status_code=404, detail="User not found")
+        # Concurrent misses for the same profile share one read
+        user = await profile_reads.do(username, lambda: load_profile(db, username))
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+    # Include score updates that are still buffered in the write-behind aggregator
+    user = scores.overlay(user)
+
+    etag = make_etag(user["_id"], user.get("version", 0))
+    if etag_matches(request, etag):
+        return not_modified(etag, USER_CACHE_CONTROL)
+    set_cache_headers(response, etag, USER_CACHE_CONTROL)
     return UserOut(**user)
 
 # @router.post("/{username}/score", response_model=UserOut)
@@ -47,28 +147,10 @@ async def get_user(username: str, db: AsyncIOMotorDatabase = Depends(get_db)):
 #     updated = await db["users"].find_one({"username": username})
 #     return UserOut(**updated)
 
-@router.get("/leaderboard", response_model=List[LeaderboardEntry])
-async def get_leaderboard(db: AsyncIOMotorDatabase = Depends(get_db)):
-    cursor = db["users"].find().sort("score", -1).limit(10)
-    users = await cursor.to_list(length=10)
-    
-    leaderboard = []
-    for i, user in enumerate(users):
-        leaderboard.append(
-            LeaderboardEntry(
-                username=user["username"],
-                score=user["score"],
-                rank=i + 1
-            )
-        )
-    
-    return leaderboard
-
 # Helper used by other routers
 async def update_user_score(db: AsyncIOMotorDatabase, username: str, is_correct: bool):
-    user = await db["users"].find_one({"username": username})
-    if not user:
-        return
-    
-    update = {"$inc": {"score": 10, "correct_answers": 1}} if is_correct else {"$inc": {"incorrect_answers": 1}}
-    await db["users"].update_one({"username": username}, update)
\ No newline at end of file
+    # Buffered and written in bulk; deltas for unknown usernames match no document.
+    # Not filtered by known_users: a user just registered on another worker may not be in it yet.
+    # The cached profile needs no update: reads overlay the pending deltas.
+    deltas = scores.add(username, is_correct)
+    leaderboard.add_score(username, deltas.get("score", 0))
\ No newline at end of file
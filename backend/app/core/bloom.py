@@ -0,0 +1,46 @@
+import math
+from hashlib import blake2b
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings.
+
+    Sized for `capacity` items at roughly `error_rate` false positives.
+    `might_contain` never returns False for an added item. `count` only
+    counts distinct items (less the rare false positives). Indexes come from
+    one 128-bit blake2b digest split into two hashes (double hashing).
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.capacity = max(1, capacity)
+        self.size = max(64, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _indexes(self, item: str):
+        digest = blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, item: str) -> bool:
+        """Add an item; returns False if it was (probably) already there.
+
+        Only items that set a new bit are counted, so re-adding known items
+        doesn't make the filter look fuller than it is.
+        """
+        added = False
+        for index in self._indexes(item):
+            mask = 1 << (index & 7)
+            if not self._bits[index >> 3] & mask:
+                self._bits[index >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    def might_contain(self, item: str) -> bool:
+        return all(self._bits[index >> 3] & (1 << (index & 7)) for index in self._indexes(item))
+
+    __contains__ = might_contain
@@ -0,0 +1,138 @@
+import asyncio
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Callable, List, Optional
+from uuid import uuid4
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+
+from app.core.config import settings
+
+Handler = Callable[[dict], None]
+
+RESUME_OVERLAP = timedelta(seconds=10)  # How far before the last message a resumed tail starts
+RECENT_LIMIT = 10000  # Message ids remembered to skip what the overlap re-reads
+
+
+class LocalChannel:
+    """In-process stand-in for the cross-worker cache channel.
+
+    Messages published on a channel are delivered to the subscribers of
+    every other channel sharing its `hub`, never to its own. A channel on its
+    own hub (the default) delivers nothing, which is right for a single
+    worker; tests can share a hub between channels to play several workers.
+    """
+
+    def __init__(self, hub: Optional[List["LocalChannel"]] = None):
+        self.hub = hub if hub is not None else []
+        self.hub.append(self)
+        self._handlers: List[Handler] = []
+
+    def subscribe(self, handler: Handler):
+        self._handlers.append(handler)
+
+    def _deliver(self, message: dict):
+        for handler in self._handlers:
+            try:
+                handler(message)
+            except Exception as e:
+                print(f"Error handling cache channel message: {e}")
+
+    async def publish(self, message: dict):
+        for channel in self.hub:
+            if channel is not self:
+                channel._deliver(message)
+
+    def start(self, db: AsyncIOMotorDatabase):
+        pass
+
+    async def stop(self):
+        pass
+
+
+class MongoChannel(LocalChannel):
+    """Cache channel shared by all workers through a capped collection.
+
+    Each worker appends its messages and follows the collection with a
+    tailable cursor, skipping its own. Old messages are overwritten once
+    the collection is full, so it stays small.
+
+    The cursor returns messages in insertion order, but ObjectIds from
+    different processes are only roughly ordered, so a tail that has to be
+    reopened resumes a little before the last message it saw and skips the
+    ids it has already delivered.
+    """
+
+    def __init__(self, collection: str = "cache_channel", size_bytes: int = 1024 * 1024):
+        super().__init__()
+        self.collection = collection
+        self.size_bytes = size_bytes
+        self.origin = uuid4().hex
+        self._db: Optional[AsyncIOMotorDatabase] = None
+        self._tail_task: Optional[asyncio.Task] = None
+        self._recent: "OrderedDict[ObjectId, None]" = OrderedDict()
+
+    async def publish(self, message: dict):
+        if self._db is None:
+            return
+        try:
+            await self._db[self.collection].insert_one({"origin": self.origin, "message": message})
+        except Exception as e:
+            print(f"Error publishing cache channel message: {e}")
+
+    def start(self, db: AsyncIOMotorDatabase):
+        self._db = db
+        if self._tail_task is None:
+            self._tail_task = asyncio.create_task(self._tail())
+
+    async def stop(self):
+        if self._tail_task is not None:
+            self._tail_task.cancel()
+            try:
+                await self._tail_task
+            except asyncio.CancelledError:
+                pass
+            self._tail_task = None
+
+    def _is_new(self, message_id: ObjectId) -> bool:
+        if message_id in self._recent:
+            return False
+        self._recent[message_id] = None
+        if len(self._recent) > RECENT_LIMIT:
+            self._recent.popitem(last=False)
+        return True
+
+    async def _tail(self):
+        collection = self._db[self.collection]
+        last_id = None
+        while True:
+            try:
+                if last_id is None:
+                    try:
+                        await self._db.create_collection(self.collection, capped=True, size=self.size_bytes)
+                    except CollectionInvalid:
+                        pass  # Already created by another worker
+                    # A tailable cursor on an empty capped collection dies at once, so start from a marker
+                    marker = await collection.insert_one({"origin": self.origin, "message": {"type": "hello"}})
+                    last_id = marker.inserted_id
+                resume_from = ObjectId.from_datetime(last_id.generation_time - RESUME_OVERLAP)
+                cursor = collection.find({"_id": {"$gte": resume_from}}, cursor_type=CursorType.TAILABLE_AWAIT)
+                async for doc in cursor:
+                    if not self._is_new(doc["_id"]):
+                        continue
+                    if doc["_id"] > last_id:
+                        last_id = doc["_id"]
+                    if doc.get("origin") != self.origin:
+                        self._deliver(doc.get("message", {}))
+                await asyncio.sleep(0.5)  # The cursor was closed: resume around the last message seen
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error following cache channel: {e}")
+                await asyncio.sleep(1)
+
+
+channel = MongoChannel() if settings.CACHE_CHANNEL == "mongo" else LocalChannel()
@@ -4,6 +4,19 @@ from pydantic_settings import BaseSettings
 class Settings(BaseSettings):
     APP_NAME: str = "Globetrotter API"
     MONGO_DB_URI: str = os.getenv("MONGODB_URI", "mongodb://localhost:27017/travel_destinations")  # Default MongoDB URI
+
+    # Motor connection pool settings (per worker process)
+    MONGO_MAX_POOL_SIZE: int = 100
+    MONGO_MIN_POOL_SIZE: int = 10  # Connections kept open and warmed at startup
+    MONGO_MAX_IDLE_TIME_MS: int = 60000
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = 5000
+    SKIP_INDEX_CREATION: bool = False  # Set in production once `scripts/migrate.py` has created the indexes
+
+    # Server settings used by `python main.py --production`
+    PORT: int = 8000  # Cloud Run sets PORT
+    WEB_CONCURRENCY: int = 0  # Worker processes; 0 means one per available CPU
+    SERVER_BACKLOG: int = 2048
+    SERVER_KEEP_ALIVE_SECONDS: int = 620  # Longer than the Google front end's 600s idle timeout
     
     # CORS Settings
     CORS_ORIGINS: list = ["*"]
@@ -12,6 +25,48 @@ class Settings(BaseSettings):
     SECRET_KEY: str = os.getenv("SECRET_KEY", "development_secret_key")
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 7  # 7 days
+    ROUND_TOKEN_EXPIRE_SECONDS: int = 60 * 30  # 30 minutes
+
+    # Destination catalog settings
+    CATALOG_REFRESH_INTERVAL_SECONDS: int = 300  # 0 disables the background refresh
+    SEEN_CACHE_SIZE: int = 10000  # Users whose seen-destination bitsets are kept in memory
+    SEEN_FLUSH_INTERVAL_SECONDS: float = 5.0
+    CATALOG_SNAPSHOT_PATH: str = ""  # Load the catalog from this file at startup instead of Mongo
+
+    # Score write-behind settings
+    SCORE_FLUSH_INTERVAL_SECONDS: float = 1.0
+    SCORE_FLUSH_MAX_PENDING: int = 500  # Flush early once this many users have pending deltas
+    LEADERBOARD_REFRESH_INTERVAL_SECONDS: int = 60  # Reconcile with scores written by other workers
+    LEADERBOARD_STREAM_SIZE: int = 10  # Entries on the live leaderboard stream
+    LEADERBOARD_STREAM_WINDOW_SECONDS: float = 0.25  # Changes within this window go out as one diff
+
+    # Username Bloom filter settings
+    USERNAME_FILTER_CAPACITY: int = 1_000_000  # Users the filter is sized for; it is rebuilt larger when exceeded
+    USERNAME_FILTER_ERROR_RATE: float = 0.01
+    USERNAME_FILTER_POLL_SECONDS: float = 2.0  # How quickly users registered on other workers are recognised; 0 disables the filter
+
+    # User profile cache settings
+    USER_CACHE_SIZE: int = 10000  # Profiles kept in memory per worker
+    USER_CACHE_TTL_SECONDS: float = 30.0  # Bounds staleness if an invalidation from another worker is missed
+    CACHE_CHANNEL: str = "local"  # "mongo" broadcasts invalidations to the other workers; main.py picks it for more than one worker
+
+    # Concurrent identical reads share one Mongo query; a request waits at most this long for it
+    READ_COALESCE_TIMEOUT_SECONDS: float = 5.0
+
+    # Live challenge room settings
+    LIVE_ROOM_ROUNDS: int = 10
+    LIVE_ROOM_RECONNECT_SECONDS: float = 30.0  # An empty room is closed after this long
+    LIVE_ROOM_MAX_SECONDS: float = 60 * 60
+    LIVE_ROOM_FLUSH_INTERVAL_SECONDS: float = 2.0  # Closed rooms' results are written in one batch per interval
+    LIVE_ROOM_LEASE_SECONDS: float = 30.0  # A room is reopened on another worker this long after its worker stops renewing
+    LIVE_SUBSCRIBER_MAX_QUEUED: int = 100  # Connections further behind than this many messages are dropped
+
+    # Challenge expiry settings
+    CHALLENGE_SWEEP_INTERVAL_SECONDS: int = 60  # How often pending challenges are checked for expiry
+    CHALLENGE_RETENTION_SECONDS: int = 60 * 60 * 24 * 30  # TTL: delete challenges 30 days after they expire
+
+    # HTTP caching settings
+    CHALLENGE_CACHE_MAX_AGE_SECONDS: int = 60  # Cache-Control max-age for challenge pages
     
     class Config:
         # env_file = ".env"
@@ -0,0 +1,69 @@
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from fastapi import Request, Response
+
+from app.core.config import settings
+
+
+def make_etag(*parts) -> str:
+    """Weak ETag built from a document id and its version counter"""
+    return 'W/"' + "-".join(str(part) for part in parts) + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Weak comparison of an ETag against the request's If-None-Match header"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in header.split(","))
+
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+
+
+def set_cache_headers(response: Response, etag: str, cache_control: str):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
+
+
+class ETagCache:
+    """Recently served ETags by key, so a matching revalidation can be answered
+    with 304 without reading the database.
+
+    Entries expire after `ttl` seconds, which bounds how stale a 304 can be
+    for changes made by other workers. Local writes invalidate their key.
+    """
+
+    def __init__(self, ttl: float, capacity: int = 10000):
+        self.ttl = ttl
+        self.capacity = capacity
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        etag, deadline = entry
+        if deadline < time.monotonic():
+            del self._entries[key]
+            return None
+        return etag
+
+    def set(self, key: str, etag: str, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        self._entries[key] = (etag, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: str):
+        self._entries.pop(key, None)
+
+
+challenge_etags = ETagCache(ttl=settings.CHALLENGE_CACHE_MAX_AGE_SECONDS)
@@ -0,0 +1,286 @@
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from pymongo import monitoring
+from starlette.routing import Match
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROUND_TRIP_BUCKETS = (0, 1, 2, 3, 4, 5, 8, 13, 21)
+
+# Mongo commands issued while serving the current request. Motor runs pymongo
+# in an executor with a copy of the caller's context, so listener callbacks
+# see the same list object as the request that issued the command.
+_round_trips: ContextVar[Optional[List[int]]] = ContextVar("mongo_round_trips", default=None)
+
+# When set (the benchmarks do), each response reports the Mongo commands issued
+# before it started in this header, so callers can count them per request
+round_trip_header: Optional[str] = None
+
+
+def _format_labels(labelnames: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # Per label set: non-cumulative bucket counts, then the +Inf count and the sum
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def snapshot(self, **labels) -> Tuple[int, float]:
+        """Return the (count, sum) observed for a label set"""
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return (int(sum(series[:-1])), series[-1]) if series else (0, 0.0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip((*self.buckets, "+Inf"), series[:-1]):
+                    cumulative += count
+                    le = 'le="%s"' % (bound if bound == "+Inf" else _format_value(bound))
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(series[-1])}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self._metrics for line in metric.render()) + "\n"
+
+
+registry = Registry()
+
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status")
+))
+http_requests_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served by route", ("method", "route")
+))
+mongo_command_duration = registry.register(Histogram(
+    "mongo_command_duration_seconds", "Mongo command latency by collection and command", ("collection", "command")
+))
+mongo_command_failures = registry.register(Counter(
+    "mongo_command_failures_total", "Mongo commands that failed by collection and command", ("collection", "command")
+))
+mongo_round_trips = registry.register(Histogram(
+    "mongo_round_trips_per_request", "Mongo commands issued per HTTP request by route", ("method", "route"),
+    buckets=ROUND_TRIP_BUCKETS
+))
+cache_requests = registry.register(Counter(
+    "cache_requests_total", "In-process cache lookups by cache and result (hit or miss)", ("cache", "result")
+))
+cache_evictions = registry.register(Counter(
+    "cache_evictions_total", "In-process cache entries removed by cache and reason", ("cache", "reason")
+))
+cache_entries = registry.register(Gauge(
+    "cache_entries", "Entries currently held by each in-process cache", ("cache",)
+))
+singleflight_calls = registry.register(Counter(
+    "singleflight_calls_total", "Coalesced reads by group and result (executed or shared)", ("group", "result")
+))
+pubsub_dropped_subscribers = registry.register(Counter(
+    "pubsub_dropped_subscribers_total", "Subscribers disconnected for falling too far behind, by topic kind", ("topic",)
+))
+live_rooms = registry.register(Gauge(
+    "live_rooms", "Live challenge rooms open in this worker"
+))
+live_connections = registry.register(Gauge(
+    "live_connections", "WebSocket connections to live challenge rooms in this worker"
+))
+app_startup_seconds = registry.register(Gauge(
+    "app_startup_seconds", "Seconds from process start until the app was ready to serve"
+))
+app_first_request_seconds = registry.register(Gauge(
+    "app_first_request_seconds", "Seconds from process start until the first request was served"
+))
+
+# Fallback for process_start_time where /proc is not available
+_imported_at = time.time()
+
+
+def process_start_time() -> float:
+    """Wall-clock time this process was started, from /proc where available"""
+    try:
+        with open("/proc/self/stat") as f:
+            # Field 22, counted after the parenthesised command name which may contain spaces
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/stat") as f:
+            boot_time = next(int(line.split()[1]) for line in f if line.startswith("btime"))
+        return boot_time + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, StopIteration):
+        return _imported_at
+
+
+def seconds_since_start() -> float:
+    return time.time() - process_start_time()
+
+
+def record_round_trip():
+    """Count a Mongo command against the request being served, if any"""
+    counter = _round_trips.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Records per-collection command timings and per-request round trips"""
+
+    def __init__(self):
+        self._collections: Dict[Tuple, str] = {}
+
+    @staticmethod
+    def _collection(event: monitoring.CommandStartedEvent) -> str:
+        if event.command_name == "getMore":
+            return str(event.command.get("collection", ""))
+        target = event.command.get(event.command_name)
+        return target if isinstance(target, str) else ""
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        self._collections[(event.connection_id, event.request_id)] = self._collection(event)
+        record_round_trip()
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        mongo_command_duration.observe(event.duration_micros / 1e6, collection=collection, command=event.command_name)
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        mongo_command_duration.observe(event.duration_micros / 1e6, collection=collection, command=event.command_name)
+        mongo_command_failures.inc(collection=collection, command=event.command_name)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, in-flight requests and Mongo round trips per route"""
+
+    def __init__(self, app):
+        self.app = app
+        self._first_request_served = False
+
+    def _route(self, scope) -> str:
+        # Label by route template rather than raw path to keep cardinality bounded
+        for route in scope["app"].router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "path", "unmatched")
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method, route = scope["method"], self._route(scope)
+        status = {"code": 500}
+
+        counter = [0]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                if round_trip_header:
+                    headers = [*message.get("headers", []), (round_trip_header.encode(), str(counter[0]).encode())]
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        token = _round_trips.set(counter)
+        http_requests_in_flight.inc(method=method, route=route)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_request_duration.observe(time.perf_counter() - start, method=method, route=route, status=status["code"])
+            mongo_round_trips.observe(counter[0], method=method, route=route)
+            http_requests_in_flight.dec(method=method, route=route)
+            _round_trips.reset(token)
+            if not self._first_request_served:
+                self._first_request_served = True
+                app_first_request_seconds.set(seconds_since_start())
+
+
+mongo_listener = MongoCommandListener()
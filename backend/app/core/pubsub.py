@@ -0,0 +1,103 @@
+import asyncio
+import json
+from typing import AsyncIterator, Dict, Optional, Set
+
+from app.core.metrics import pubsub_dropped_subscribers
+
+_CLOSED = None  # Queued after the last message of a closed subscription
+
+
+def encode(message: dict) -> str:
+    return json.dumps(message, default=str)
+
+
+class Subscription:
+    """One subscriber's queue of encoded messages on a topic.
+
+    Iterating yields messages until the subscription is closed, either by
+    the subscriber, by closing the topic, or because the subscriber fell
+    more than `max_queued` messages behind.
+    """
+
+    def __init__(self, hub: "PubSub", topic: str, max_queued: int):
+        self.hub = hub
+        self.topic = topic
+        self.max_queued = max_queued
+        self.closed = False
+        self._queue: "asyncio.Queue[Optional[str]]" = asyncio.Queue()
+
+    def push(self, data: str):
+        if self.closed:
+            return
+        if self._queue.qsize() >= self.max_queued:
+            # A slow consumer must not hold memory for everyone else's messages
+            pubsub_dropped_subscribers.inc(topic=self.topic.split(":", 1)[0])
+            self.close()
+            return
+        self._queue.put_nowait(data)
+
+    def send(self, message: dict):
+        """Deliver a message to this subscriber only"""
+        self.push(encode(message))
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.hub.unsubscribe(self)
+            self._queue.put_nowait(_CLOSED)
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        while True:
+            data = await self._queue.get()
+            if data is _CLOSED:
+                return
+            yield data
+
+
+class PubSub:
+    """In-process topic fan-out.
+
+    A published message is encoded once and queued for every subscriber of
+    its topic, so the cost of a publish doesn't depend on how fast each
+    subscriber sends. Messages stay within this worker.
+    """
+
+    def __init__(self, max_queued: int = 100):
+        self.max_queued = max_queued
+        self._topics: Dict[str, Set[Subscription]] = {}
+
+    def subscribe(self, topic: str) -> Subscription:
+        subscription = Subscription(self, topic, self.max_queued)
+        self._topics.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._topics.get(subscription.topic)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._topics[subscription.topic]
+
+    def subscribers(self, topic: str) -> int:
+        return len(self._topics.get(topic, ()))
+
+    def publish(self, topic: str, message: dict) -> int:
+        """Queue a message for every subscriber of a topic and return how many there were"""
+        if topic not in self._topics:
+            return 0
+        return self.publish_raw(topic, encode(message))
+
+    def publish_raw(self, topic: str, data: str) -> int:
+        """Like `publish`, for a message the caller has already encoded"""
+        subscribers = list(self._topics.get(topic, ()))
+        for subscription in subscribers:
+            subscription.push(data)
+        return len(subscribers)
+
+    def close_topic(self, topic: str):
+        """End every subscription to a topic after its queued messages"""
+        for subscription in list(self._topics.get(topic, ())):
+            subscription.close()
+
+
+pubsub = PubSub()
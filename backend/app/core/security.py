@@ -0,0 +1,68 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+from typing import Any, Dict
+
+from app.core.config import settings
+
+
+class InvalidRoundToken(ValueError):
+    """Raised when a round token is malformed, tampered with or expired"""
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(message: bytes) -> bytes:
+    return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).digest()
+
+
+def answer_digest(destination_id: str, answer: str) -> str:
+    """Keyed digest of an answer, so the token does not give the answer away"""
+    message = f"answer:{destination_id}:{answer.strip().lower()}".encode()
+    return _b64encode(_sign(message)[:16])
+
+
+def create_round_token(destination_id: str, answer: str, fun_fact_index: int) -> str:
+    """Create a signed token describing a served round.
+
+    The payload is only signed, not encrypted, so it holds a digest of the
+    answer and the index of the fun fact to show rather than their text.
+    """
+    claims = {
+        "d": destination_id,
+        "a": answer_digest(destination_id, answer),
+        "f": fun_fact_index,
+        "e": int(time.time()) + settings.ROUND_TOKEN_EXPIRE_SECONDS,
+    }
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+    return f"{payload}.{_b64encode(_sign(payload.encode()))}"
+
+
+def decode_round_token(token: str) -> Dict[str, Any]:
+    """Verify a round token's signature and expiry and return its claims"""
+    try:
+        payload, signature = token.split(".")
+        valid = hmac.compare_digest(_b64decode(signature), _sign(payload.encode()))
+    except (ValueError, TypeError):
+        raise InvalidRoundToken("Malformed round token")
+    if not valid:
+        raise InvalidRoundToken("Invalid round token signature")
+    try:
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        raise InvalidRoundToken("Malformed round token")
+    if claims.get("e", 0) < time.time():
+        raise InvalidRoundToken("Round token has expired")
+    return claims
+
+
+def round_answer_matches(claims: Dict[str, Any], answer: str) -> bool:
+    return hmac.compare_digest(claims.get("a", ""), answer_digest(claims.get("d", ""), answer))
@@ -0,0 +1,55 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from app.core.metrics import singleflight_calls
+
+
+class SingleFlightTimeout(asyncio.TimeoutError):
+    """A coalesced call took longer than its timeout"""
+
+
+class SingleFlight:
+    """Collapses concurrent identical reads into one call.
+
+    The first caller for a key starts the call; callers arriving while it
+    is in flight wait for the same result, or get the same exception. The
+    key is released as soon as the call finishes, so nothing is cached:
+    this only bounds concurrent work to one call per key.
+
+    A call that exceeds `timeout` fails with SingleFlightTimeout for every
+    waiter and releases its key. A waiter that is cancelled (e.g. its client
+    disconnected) does not cancel the call for the others.
+
+    Results are shared objects: callers must copy them before mutating.
+    """
+
+    def __init__(self, group: str, timeout: Optional[float] = None):
+        self.group = group
+        self.timeout = timeout
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]], timeout: Optional[float] = None) -> Any:
+        call = self._calls.get(key)
+        if call is None:
+            call = asyncio.ensure_future(self._run(key, fn, self.timeout if timeout is None else timeout))
+            self._calls[key] = call
+            call.add_done_callback(lambda done: self._release(key, done))
+            singleflight_calls.inc(group=self.group, result="executed")
+        else:
+            singleflight_calls.inc(group=self.group, result="shared")
+        return await asyncio.shield(call)
+
+    async def _run(self, key: Hashable, fn: Callable[[], Awaitable[Any]], timeout: Optional[float]) -> Any:
+        try:
+            return await asyncio.wait_for(fn(), timeout)
+        except asyncio.TimeoutError:
+            raise SingleFlightTimeout(f"{self.group} call for {key!r} timed out after {timeout}s")
+
+    def _release(self, key: Hashable, call: asyncio.Future):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if not call.cancelled():
+            call.exception()  # Retrieved here so an error nobody waited for is not logged as unhandled
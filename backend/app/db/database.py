@@ -1,12 +1,32 @@
 import motor.motor_asyncio
 from app.core.config import settings  # Import the settings
+from app.core.metrics import mongo_listener
 from typing import AsyncGenerator
 
-# Create Motor client (asynchronous)
-client = motor.motor_asyncio.AsyncIOMotorClient(settings.MONGO_DB_URI)
+# Create Motor client (asynchronous). Connections are opened lazily; `connect` warms the pool on startup
+client = motor.motor_asyncio.AsyncIOMotorClient(
+    settings.MONGO_DB_URI,
+    maxPoolSize=settings.MONGO_MAX_POOL_SIZE,
+    minPoolSize=settings.MONGO_MIN_POOL_SIZE,
+    maxIdleTimeMS=settings.MONGO_MAX_IDLE_TIME_MS,
+    serverSelectionTimeoutMS=settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    event_listeners=[mongo_listener],
+)
 # db = client[settings.MONGO_DB_URI.split('/')[-1]]  # Extract the database name from the URI
 db = client["destinations"]
 
+# Open the connection pool before the first request instead of during it.
+# Once a server is selected, the driver keeps minPoolSize connections open in the background.
+async def connect():
+    try:
+        await db.command("ping")
+        print("Connected to MongoDB.")
+    except Exception as e:
+        print(f"Error connecting to MongoDB: {e}")
+
+def close():
+    client.close()
+
 # Asynchronous database session (similar to get_db in SQLAlchemy)
 async def get_db() -> AsyncGenerator:
     try:
@@ -15,14 +35,40 @@ async def get_db() -> AsyncGenerator:
         pass  # No explicit close needed with Motor in most cases
 
 # Asynchronous function to create indexes (run this on startup)
-async def create_indexes():
+async def create_indexes() -> bool:
+    """Create the indexes the app relies on; returns False if any failed"""
     try:
         # Index on Destination.alias (unique)
         await db["travel_destinations"].create_index([("alias", 1)], unique=True, name="alias_unique", background=True)
+        # Index on Destination.ordinal (unique once assigned; see app/services/ordinals.py)
+        await db["travel_destinations"].create_index(
+            [("ordinal", 1)], unique=True, partialFilterExpression={"ordinal": {"$exists": True}},
+            name="ordinal_unique", background=True
+        )
         # Index on User.username (unique)
         await db["users"].create_index([("username", 1)], unique=True, name="username_unique", background=True)
+        # Index on User.updated_at, for the leaderboard's reconcile of changed users
+        await db["users"].create_index([("updated_at", 1)], name="updated_at", background=True)
         # Index on Challenge.challenge_code (unique)
         await db["challenges"].create_index([("challenge_code", 1)], unique=True, name="challenge_code_unique", background=True)
+        # Indexes for per-user challenge history, matching its (created_at, _id) keyset sort
+        await db["challenges"].create_index(
+            [("challenger_username", 1), ("created_at", -1), ("_id", -1)], name="challenger_history", background=True
+        )
+        await db["challenges"].create_index(
+            [("to_username", 1), ("created_at", -1), ("_id", -1)], name="recipient_history", background=True
+        )
+        # TTL index on Challenge.expires_at (also serves the expiry sweeper's range query)
+        await db["challenges"].create_index(
+            [("expires_at", 1)],
+            expireAfterSeconds=settings.CHALLENGE_RETENTION_SECONDS,
+            name="expires_at_ttl",
+            background=True
+        )
+        # TTL index on the live room leases, to clean up after workers that died holding one
+        await db["live_rooms"].create_index([("expires_at", 1)], expireAfterSeconds=3600, name="expires_at_ttl", background=True)
         print("Indexes created or verified successfully.")
+        return True
     except Exception as e:
-        print(f"Error creating indexes: {e}")
\ No newline at end of file
+        print(f"Error creating indexes: {e}")
+        return False
\ No newline at end of file
@@ -1,19 +1,96 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from app.api.destinations import router as destinations_router
 from app.api.users import router as users_router
 from app.api.challenges import router as challenges_router
-from app.db.database import create_indexes
+from app.db.database import close as close_db, connect as connect_db, create_indexes, db
+from app.services.catalog import catalog
+from app.services.challenge_sweeper import challenge_sweeper
+from app.services.known_users import known_users
+from app.services.leaderboard import leaderboard
+from app.services.leaderboard_stream import leaderboard_stream
+from app.services.profiles import profiles
+from app.services.rooms import rooms
+from app.services.sampler import sampler
+from app.services.scores import scores
 from contextlib import asynccontextmanager
+from app.core.channel import channel
 from app.core.config import settings
+from app.core.pubsub import pubsub
+from app.core.singleflight import SingleFlightTimeout
+from app.core.metrics import MetricsMiddleware, app_startup_seconds, registry, seconds_since_start
+from app.services.catalog_snapshot import SnapshotError
+from app.services.ordinals import number_destinations
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup logic: Create database indexes
-    await create_indexes()
+    # Startup logic: Warm the connection pool, create database indexes and load the destination catalog
+    await connect_db()
+    if not settings.SKIP_INDEX_CREATION:
+        await create_indexes()
+        await number_destinations(db)
+    from_snapshot = False
+    if settings.CATALOG_SNAPSHOT_PATH:
+        try:
+            catalog.load_snapshot(settings.CATALOG_SNAPSHOT_PATH)
+            from_snapshot = True
+            print(f"Loaded {len(catalog)} destinations from snapshot {settings.CATALOG_SNAPSHOT_PATH}.")
+        except SnapshotError as e:
+            print(f"Error loading catalog snapshot, falling back to MongoDB: {e}")
+    if not from_snapshot:
+        try:
+            await catalog.load(db)
+            print(f"Loaded {len(catalog)} destinations into the catalog.")
+        except Exception as e:
+            print(f"Error loading destination catalog: {e}")
+    # A snapshot may be older than the collection, so catch up with Mongo in the background
+    catalog.start(db, settings.CATALOG_REFRESH_INTERVAL_SECONDS, refresh_now=from_snapshot)
+    try:
+        await leaderboard.load(db)
+    except Exception as e:
+        print(f"Error loading leaderboard: {e}")
+    leaderboard.start(db, settings.LEADERBOARD_REFRESH_INTERVAL_SECONDS)
+    leaderboard_stream.size = settings.LEADERBOARD_STREAM_SIZE
+    leaderboard_stream.window = settings.LEADERBOARD_STREAM_WINDOW_SECONDS
+    leaderboard_stream.start()
+    known_users.capacity = settings.USERNAME_FILTER_CAPACITY
+    known_users.error_rate = settings.USERNAME_FILTER_ERROR_RATE
+    known_users.start(db, settings.USERNAME_FILTER_POLL_SECONDS)
+    profiles.capacity = settings.USER_CACHE_SIZE
+    profiles.ttl = settings.USER_CACHE_TTL_SECONDS
+    channel.subscribe(profiles.handle)
+    channel.subscribe(known_users.handle)
+    channel.subscribe(rooms.handle)
+    channel.start(db)
+    scores.max_pending = settings.SCORE_FLUSH_MAX_PENDING
+    scores.start(db, settings.SCORE_FLUSH_INTERVAL_SECONDS)
+    sampler.capacity = settings.SEEN_CACHE_SIZE
+    sampler.start(db, settings.SEEN_FLUSH_INTERVAL_SECONDS)
+    challenge_sweeper.start(db, settings.CHALLENGE_SWEEP_INTERVAL_SECONDS)
+    pubsub.max_queued = settings.LIVE_SUBSCRIBER_MAX_QUEUED
+    rooms.rounds = settings.LIVE_ROOM_ROUNDS
+    rooms.grace = settings.LIVE_ROOM_RECONNECT_SECONDS
+    rooms.max_age = settings.LIVE_ROOM_MAX_SECONDS
+    rooms.lease = settings.LIVE_ROOM_LEASE_SECONDS
+    rooms.start(db, settings.LIVE_ROOM_FLUSH_INTERVAL_SECONDS)
+    startup_seconds = seconds_since_start()
+    app_startup_seconds.set(startup_seconds)
+    print(f"Startup completed in {startup_seconds * 1000:.0f} ms.")
     yield
-    # Shutdown logic (if any) -  Motor usually handles connection closing automatically
+    # Shutdown logic: stop background tasks, flush buffered writes and close the connection pool
+    await catalog.stop()
+    await leaderboard.stop()
+    await leaderboard_stream.stop()
+    await known_users.stop()
+    # Closing the rooms buffers their scores, so stop them before the final score flush
+    await rooms.stop()
+    await scores.stop()
+    await channel.stop()
+    await sampler.stop()
+    await challenge_sweeper.stop()
+    close_db()
 
 
 app = FastAPI(title="Globetrotter API", description="API for the Globetrotter travel quiz game", lifespan=lifespan)
@@ -26,6 +103,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Added last so it is outermost and times the whole request
+app.add_middleware(MetricsMiddleware)
 
 # Include routers
 app.include_router(destinations_router, prefix="/api/destinations", tags=["destinations"])
@@ -33,6 +112,17 @@ app.include_router(users_router, prefix="/api/users", tags=["users"])
 app.include_router(challenges_router, prefix="/api/challenges", tags=["challenges"])
 
 
+@app.exception_handler(SingleFlightTimeout)
+async def read_timeout_handler(request, exc: SingleFlightTimeout):
+    return JSONResponse(status_code=503, content={"detail": "Database read timed out"})
+
+
 @app.get("/")
 async def root():
-    return {"message": "Welcome to the Globetrotter API"}
\ No newline at end of file
+    return {"message": "Welcome to the Globetrotter API"}
+
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    """Prometheus text exposition of request and Mongo metrics"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -1,12 +1,23 @@
 from datetime import datetime
 from pydantic import BaseModel
+from typing import Dict, List, Optional
 
 class ChallengeCreate(BaseModel):
     challenger_username: str
+    to_username: Optional[str] = None
 
 class Challenge(BaseModel):
     id: str
     challenge_code: str
     challenger_username: str
     challenger_score: int
-    created_at: datetime
\ No newline at end of file
+    to_username: Optional[str] = None
+    status: str = "pending"
+    created_at: datetime
+    expires_at: Optional[datetime] = None
+    results: Optional[Dict[str, int]] = None  # Scores by username once played live
+    winner: Optional[str] = None
+
+class ChallengePage(BaseModel):
+    items: List[Challenge]
+    next_after: Optional[str] = None  # Pass as `after` to fetch the next page
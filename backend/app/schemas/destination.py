@@ -29,14 +29,26 @@ class DestinationClue(BaseModel):
     clues: List[str]
     options: List[str]
     alias: str
+    round_token: Optional[str] = None
 
 class AnswerVerification(BaseModel):
     destination_id: str
     user_answer: str
     username: str
+    round_token: Optional[str] = None
 
 class AnswerResponse(BaseModel):
     correct: bool
     correct_answer: str
     fun_fact: str
-    points_earned: Optional[int] = None
\ No newline at end of file
+    points_earned: Optional[int] = None
+class BulkLineError(BaseModel):
+    line: int
+    error: str
+
+class BulkInsertSummary(BaseModel):
+    received: int
+    inserted: int
+    failed: int
+    inserted_ids: List[str]
+    errors: List[BulkLineError]  # Only the first failures are listed; `failed` counts all of them
@@ -0,0 +1,185 @@
+import asyncio
+import copy
+import random
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.core.singleflight import SingleFlight
+from app.services.catalog_snapshot import read_snapshot
+
+if TYPE_CHECKING:
+    from app.services.distractors import DistractorIndex
+
+COLLECTION = "travel_destinations"
+PROJECTION = {"ordinal": 1, "name": 1, "alias": 1, "clues": 1, "fun_facts": 1}
+
+
+class DestinationCatalog:
+    """Process-local copy of the destination collection.
+
+    The catalog is small and read on every round, so it is loaded once at
+    startup and then kept in sync from the write endpoints and a periodic
+    background refresh. Serving a round from it needs no database calls.
+
+    Destinations are ordered by `_id` and kept at dense positions, which
+    the similar-destination pools index. Positions survive appends, but a
+    deletion or an `_id` that sorts before existing ones (ObjectIds from
+    different processes are only roughly ordered) shifts the destinations
+    after it; each such reload starts a new `generation`. State that
+    outlives a reload, like per-user seen-sets, uses the stable `ordinal`
+    stored on each destination instead (see app/services/ordinals.py).
+
+    The similar-destination pools are built and extended off the event
+    loop, so neither loading nor adding destinations blocks requests;
+    rounds use random distractors for destinations the pools don't cover
+    yet.
+    """
+
+    def __init__(self):
+        self._destinations: List[Dict[str, Any]] = []
+        self._by_id: Dict[str, int] = {}
+        self._by_ordinal: Dict[int, Dict[str, Any]] = {}
+        self._refresh_task: Optional[asyncio.Task] = None
+        self.loaded_at: Optional[datetime] = None
+        self.similar: Optional["DistractorIndex"] = None
+        self._similar_task: Optional[asyncio.Task] = None
+        self.generation = 0  # Bumped when the catalog is replaced other than by appending
+        self._loads = SingleFlight("catalog")
+
+    def __len__(self) -> int:
+        return len(self._destinations)
+
+    async def load(self, db: AsyncIOMotorDatabase):
+        """Replace the catalog with the current contents of the collection"""
+        # Concurrent loads (startup, the refresh loop) share one read of the collection
+        docs = await self._loads.do(COLLECTION, lambda: db[COLLECTION].find({}, PROJECTION).sort("_id", 1).to_list(length=None))
+        self._replace(docs)
+
+    def load_snapshot(self, path: str):
+        """Replace the catalog with the contents of a snapshot file"""
+        self._replace(read_snapshot(path))
+
+    def _replace(self, docs: List[Dict[str, Any]]):
+        # Build the new state off to the side and swap it in one assignment so
+        # readers never see a half-built catalog.
+        by_id = {str(doc["_id"]): i for i, doc in enumerate(docs)}
+        by_ordinal = {doc["ordinal"]: doc for doc in docs if doc.get("ordinal") is not None}
+        known = len(self._destinations)
+        appended = known <= len(docs) and all(
+            docs[i]["_id"] == self._destinations[i]["_id"] and docs[i].get("ordinal") == self._destinations[i].get("ordinal")
+            for i in range(known)
+        )
+        self._destinations, self._by_id, self._by_ordinal = docs, by_id, by_ordinal
+        self.loaded_at = datetime.utcnow()
+        if not appended:
+            self.generation += 1
+            self.similar = None
+        # Only destinations were appended: the pools are extended in the background
+        self._update_similar()
+
+    def _update_similar(self):
+        if self._similar_task is None or self._similar_task.done():
+            self._similar_task = asyncio.create_task(self._update_similar_pools())
+
+    async def _update_similar_pools(self):
+        # NumPy is only imported here, in the background, to keep it off the startup path
+        from app.services.distractors import DistractorIndex
+
+        while self.similar is None or len(self.similar) < len(self._destinations):
+            generation, docs = self.generation, self._destinations
+            if self.similar is None:
+                index = DistractorIndex()
+                await asyncio.to_thread(index.build, list(docs))
+            else:
+                # add() replaces the index arrays rather than writing into them, so
+                # a shallow copy can be extended while readers use the current one
+                index = copy.copy(self.similar)
+                await asyncio.to_thread(index.add, docs[len(index):len(docs)])
+            if generation == self.generation:
+                self.similar = index
+
+    def add(self, docs: Iterable[Dict[str, Any]]):
+        """Add freshly inserted destinations without reloading the catalog"""
+        added = []
+        for doc in docs:
+            key = str(doc["_id"])
+            if key in self._by_id:
+                continue
+            self._by_id[key] = len(self._destinations)
+            added.append({field: doc.get(field) for field in ("_id", *PROJECTION)})
+            self._destinations.append(added[-1])
+            if added[-1]["ordinal"] is not None:
+                self._by_ordinal[added[-1]["ordinal"]] = added[-1]
+        if added:
+            self._update_similar()
+
+    def get(self, destination_id: str) -> Optional[Dict[str, Any]]:
+        index = self._by_id.get(destination_id)
+        return self._destinations[index] if index is not None else None
+
+    @property
+    def numbered(self) -> int:
+        """Number of destinations that have an ordinal"""
+        return len(self._by_ordinal)
+
+    def with_ordinal(self, ordinal: int) -> Optional[Dict[str, Any]]:
+        return self._by_ordinal.get(ordinal)
+
+    def ordinals(self, start: int = 0) -> List[int]:
+        """Ordinals of the destinations from position `start` on"""
+        return [doc["ordinal"] for doc in self._destinations[start:] if doc.get("ordinal") is not None]
+
+    def sample(self, k: int) -> List[Dict[str, Any]]:
+        """Return up to k distinct random destinations"""
+        return random.sample(self._destinations, min(k, len(self._destinations)))
+
+    def distractors(self, destination: Dict[str, Any], k: int = 3) -> List[Dict[str, Any]]:
+        """Return k destinations other than the given one, preferring similar ones"""
+        position = self._by_id.get(str(destination["_id"]))
+        pool = self.similar.pool(position) if position is not None and self.similar is not None else []
+        if len(pool) >= k:
+            return [self._destinations[p] for p in random.sample(pool, k)]
+        others = [d for d in self.sample(k + 1) if d["_id"] != destination["_id"]]
+        return others[:k]
+
+    def start(self, db: AsyncIOMotorDatabase, interval: float, refresh_now: bool = False):
+        """Start refreshing the catalog in the background every `interval` seconds.
+
+        With `refresh_now` the first refresh runs right away, e.g. to catch up
+        with Mongo after loading a snapshot.
+        """
+        if (interval > 0 or refresh_now) and self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_loop(db, interval, refresh_now))
+
+    async def stop(self):
+        if self._similar_task is not None:
+            self._similar_task.cancel()
+            try:
+                await self._similar_task
+            except asyncio.CancelledError:
+                pass
+            self._similar_task = None
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+
+    async def _refresh_loop(self, db: AsyncIOMotorDatabase, interval: float, refresh_now: bool):
+        if not refresh_now:
+            await asyncio.sleep(interval)
+        while True:
+            try:
+                await self.load(db)
+            except Exception as e:
+                print(f"Error refreshing destination catalog: {e}")
+            if interval <= 0:
+                return
+            await asyncio.sleep(interval)
+
+
+catalog = DestinationCatalog()
@@ -0,0 +1,69 @@
+"""Versioned on-disk snapshot of the destination catalog.
+
+Layout: a fixed header (magic, format version, SHA-256 of the payload,
+payload length) followed by a compact JSON payload with one
+[id, ordinal, name, alias, clues, fun_facts] row per destination, in `_id`
+order so catalog positions match a catalog loaded from Mongo.
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+from typing import Any, Dict, Iterable, List
+
+from bson import ObjectId
+
+MAGIC = b"GTCATSNP"
+FORMAT_VERSION = 2
+HEADER = struct.Struct("<8sH2x32sQ")
+
+
+class SnapshotError(ValueError):
+    """Raised when a snapshot file is missing, truncated, corrupt or of an unknown version"""
+
+
+def write_snapshot(path: str, destinations: Iterable[Dict[str, Any]]) -> str:
+    """Write destinations to `path` atomically and return the payload's hex digest"""
+    rows = [
+        [str(d["_id"]), d.get("ordinal"), d["name"], d["alias"], d.get("clues") or [], d.get("fun_facts") or []]
+        for d in destinations
+    ]
+    payload = json.dumps(rows, separators=(",", ":"), ensure_ascii=False).encode()
+    digest = hashlib.sha256(payload).digest()
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, digest, len(payload)))
+        f.write(payload)
+    os.replace(tmp_path, path)
+    return digest.hex()
+
+
+def read_snapshot(path: str) -> List[Dict[str, Any]]:
+    """Memory-map a snapshot, verify its hash and return catalog documents"""
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if len(mapped) < HEADER.size:
+                raise SnapshotError(f"Snapshot {path} is truncated")
+            magic, version, digest, length = HEADER.unpack_from(mapped, 0)
+            if magic != MAGIC:
+                raise SnapshotError(f"{path} is not a catalog snapshot")
+            if version != FORMAT_VERSION:
+                raise SnapshotError(f"Unsupported catalog snapshot version {version}")
+            if len(mapped) != HEADER.size + length:
+                raise SnapshotError(f"Snapshot {path} is truncated")
+            view = memoryview(mapped)[HEADER.size:]
+            try:
+                if hashlib.sha256(view).digest() != digest:
+                    raise SnapshotError(f"Snapshot {path} failed its content hash check")
+                rows = json.loads(bytes(view))
+            finally:
+                view.release()
+    except (OSError, ValueError) as e:
+        if isinstance(e, SnapshotError):
+            raise
+        raise SnapshotError(f"Could not read catalog snapshot {path}: {e}")
+    return [
+        {"_id": ObjectId(_id), "ordinal": ordinal, "name": name, "alias": alias, "clues": clues, "fun_facts": fun_facts}
+        for _id, ordinal, name, alias, clues, fun_facts in rows
+    ]
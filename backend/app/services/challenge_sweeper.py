@@ -0,0 +1,60 @@
+import asyncio
+from datetime import datetime
+from typing import Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+
+class ChallengeSweeper:
+    """Marks pending challenges past their `expires_at` as expired.
+
+    Runs in the background so reads never have to write. Documents are
+    deleted later by the TTL index on `expires_at`.
+    """
+
+    def __init__(self, batch_size: int = 1000):
+        self.batch_size = batch_size
+        self._sweep_task: Optional[asyncio.Task] = None
+
+    async def sweep(self, db: AsyncIOMotorDatabase) -> int:
+        """Expire overdue challenges in batches and return how many were updated"""
+        expired = 0
+        while True:
+            overdue = {"status": "pending", "expires_at": {"$lt": datetime.now()}}
+            cursor = db["challenges"].find(overdue, {"_id": 1}).limit(self.batch_size)
+            ids = [doc["_id"] async for doc in cursor]
+            if not ids:
+                break
+            result = await db["challenges"].update_many(
+                {"_id": {"$in": ids}, "status": "pending"},
+                {"$set": {"status": "expired"}, "$inc": {"version": 1}}
+            )
+            expired += result.modified_count
+            if len(ids) < self.batch_size:
+                break
+        return expired
+
+    def start(self, db: AsyncIOMotorDatabase, interval: float):
+        """Start sweeping every `interval` seconds"""
+        if interval > 0 and self._sweep_task is None:
+            self._sweep_task = asyncio.create_task(self._sweep_loop(db, interval))
+
+    async def stop(self):
+        if self._sweep_task is not None:
+            self._sweep_task.cancel()
+            try:
+                await self._sweep_task
+            except asyncio.CancelledError:
+                pass
+            self._sweep_task = None
+
+    async def _sweep_loop(self, db: AsyncIOMotorDatabase, interval: float):
+        while True:
+            try:
+                await self.sweep(db)
+            except Exception as e:
+                print(f"Error sweeping expired challenges: {e}")
+            await asyncio.sleep(interval)
+
+
+challenge_sweeper = ChallengeSweeper()
@@ -0,0 +1,111 @@
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+NGRAM = 3
+ADD_BATCH_SIZE = 512  # Bounds the similarity block computed per batch of additions
+
+
+def _text(destination: Dict) -> str:
+    return " ".join([*(destination.get("clues") or []), *(destination.get("fun_facts") or [])]).lower()
+
+
+def hashed_ngrams(texts: Iterable[str], n_features: int) -> np.ndarray:
+    """L2-normalised hashed character n-gram counts, one row per text"""
+    texts = list(texts)
+    matrix = np.zeros((len(texts), n_features), dtype=np.float32)
+    for row, text in enumerate(texts):
+        data = np.frombuffer(text.encode(), dtype=np.uint8).astype(np.uint32)
+        if len(data) < NGRAM:
+            continue
+        # Pack each byte trigram into one integer, then spread it over the buckets
+        grams = (data[:-2] << 16) | (data[1:-1] << 8) | data[2:]
+        buckets = (grams * np.uint32(2654435761)) % np.uint32(n_features)
+        matrix[row] = np.bincount(buckets, minlength=n_features)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class DistractorIndex:
+    """Top-K most similar destinations for every catalog position.
+
+    Destinations are embedded as hashed character n-grams of their clues and
+    fun facts and compared by cosine similarity. The pools are computed when
+    the catalog loads and updated incrementally when destinations are added,
+    so picking the wrong options of a round is a lookup.
+    """
+
+    def __init__(self, n_features: int = 1024, pool_size: int = 8):
+        self.n_features = n_features
+        self.pool_size = pool_size
+        self._vectors = np.zeros((0, n_features), dtype=np.float32)
+        # Row i holds catalog positions of the most similar destinations, best first;
+        # -1 pads rows while the catalog is smaller than the pool
+        self._pools = np.zeros((0, pool_size), dtype=np.int64)
+        self._scores = np.zeros((0, pool_size), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self._vectors)
+
+    def build(self, destinations: List[Dict]):
+        """Recompute every pool from scratch"""
+        self._vectors = np.zeros((0, self.n_features), dtype=np.float32)
+        self._pools = np.zeros((0, self.pool_size), dtype=np.int64)
+        self._scores = np.zeros((0, self.pool_size), dtype=np.float32)
+        self.add(destinations)
+
+    def add(self, destinations: List[Dict]):
+        """Append destinations at the next positions and update affected pools"""
+        for i in range(0, len(destinations), ADD_BATCH_SIZE):
+            self._add_batch(destinations[i:i + ADD_BATCH_SIZE])
+
+    def _add_batch(self, destinations: List[Dict]):
+        if not destinations:
+            return
+        new = hashed_ngrams((_text(d) for d in destinations), self.n_features)
+        start = len(self._vectors)
+        vectors = np.vstack([self._vectors, new])
+        new_positions = np.arange(start, len(vectors))
+        # Similarity of every destination to the new ones only: O(n * m), not O(n^2)
+        similarity = vectors @ new.T
+        similarity[new_positions, np.arange(len(new))] = -np.inf
+
+        # Existing rows merge the new candidates into their pools; new rows
+        # get pools over the whole catalog
+        old_pools, old_scores = self._merge(
+            self._pools, self._scores,
+            np.broadcast_to(new_positions, (start, len(new))), similarity[:start],
+        )
+        new_pools, new_scores = self._merge(
+            np.zeros((len(new), 0), dtype=np.int64), np.zeros((len(new), 0), dtype=np.float32),
+            np.broadcast_to(np.arange(len(vectors)), (len(new), len(vectors))), similarity.T,
+        )
+        self._vectors = vectors
+        self._pools = np.vstack([old_pools, new_pools])
+        self._scores = np.vstack([old_scores, new_scores])
+
+    def _merge(self, pools, scores, candidates, candidate_scores):
+        """Keep the pool_size best of the current pool and the candidates per row"""
+        pools = np.hstack([pools, candidates]).astype(np.int64)
+        scores = np.hstack([scores, candidate_scores]).astype(np.float32)
+        scores = np.where(pools < 0, -np.inf, scores)
+        k = min(self.pool_size, pools.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        top_pools = np.take_along_axis(pools, top, axis=1)
+        top_pools[~np.isfinite(top_scores)] = -1
+        pad = self.pool_size - k
+        if pad:
+            top_pools = np.hstack([top_pools, np.full((len(pools), pad), -1, dtype=np.int64)])
+            top_scores = np.hstack([top_scores, np.full((len(pools), pad), -np.inf, dtype=np.float32)])
+        return top_pools, top_scores
+
+    def pool(self, position: int) -> List[int]:
+        """Positions of the destinations most similar to the given one"""
+        if position >= len(self._pools):
+            return []
+        return [int(p) for p in self._pools[position] if p >= 0]
@@ -0,0 +1,101 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Optional
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.core.bloom import BloomFilter
+
+# Users inserted by other workers can get ObjectIds slightly older than the
+# last poll, so each poll looks back this far
+POLL_OVERLAP = timedelta(seconds=10)
+
+
+class KnownUsers:
+    """Bloom filter of every registered username.
+
+    Requests naming a user the filter has never seen are rejected without a
+    database read. The filter is built in the background at startup; until
+    it is ready every username might exist. It is kept current by local
+    registrations and by polling the users collection for new `_id`s, which
+    bounds how long a user registered on another worker can be reported as
+    missing. It is rebuilt larger once it holds more users than it was sized
+    for. Without polling (interval 0) it never becomes ready.
+    """
+
+    def __init__(self, capacity: int = 1_000_000, error_rate: float = 0.01):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.ready = False
+        self._filter = BloomFilter(capacity, error_rate)
+        self._rebuilding: Optional[BloomFilter] = None
+        self._polled_at: Optional[datetime] = None
+        self._poll_task: Optional[asyncio.Task] = None
+
+    def might_exist(self, username: str) -> bool:
+        return not self.ready or username in self._filter
+
+    def add(self, username: str):
+        self._filter.add(username)
+        if self._rebuilding is not None:
+            self._rebuilding.add(username)
+
+    def handle(self, message: dict):
+        """Recognise users registered on other workers before the next poll"""
+        if message.get("type") == "user_registered":
+            self.add(message["username"])
+
+    async def load(self, db: AsyncIOMotorDatabase):
+        """Rebuild the filter from the users collection"""
+        started = datetime.utcnow()
+        count = await db["users"].estimated_document_count()
+        # Registrations during the scan are added to both filters by `add`
+        self._rebuilding = rebuilt = BloomFilter(max(self.capacity, 2 * count), self.error_rate)
+        try:
+            async for user in db["users"].find({}, {"_id": 0, "username": 1}):
+                rebuilt.add(user["username"])
+        finally:
+            self._rebuilding = None
+        self._filter, self._polled_at, self.ready = rebuilt, started, True
+
+    async def poll(self, db: AsyncIOMotorDatabase):
+        """Add users created since the last poll"""
+        started = datetime.utcnow()
+        since = ObjectId.from_datetime(self._polled_at - POLL_OVERLAP)
+        async for user in db["users"].find({"_id": {"$gt": since}}, {"_id": 0, "username": 1}):
+            self._filter.add(user["username"])
+        self._polled_at = started
+        if self._filter.count > self._filter.capacity:
+            await self.load(db)
+
+    def start(self, db: AsyncIOMotorDatabase, interval: float):
+        """Load the filter in the background, then poll for new users every `interval` seconds"""
+        if interval > 0 and self._poll_task is None:
+            self._poll_task = asyncio.create_task(self._poll_loop(db, interval))
+
+    async def stop(self):
+        if self._poll_task is not None:
+            self._poll_task.cancel()
+            try:
+                await self._poll_task
+            except asyncio.CancelledError:
+                pass
+            self._poll_task = None
+
+    async def _poll_loop(self, db: AsyncIOMotorDatabase, interval: float):
+        while not self.ready:
+            try:
+                await self.load(db)
+            except Exception as e:
+                print(f"Error loading known usernames: {e}")
+                await asyncio.sleep(interval)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.poll(db)
+            except Exception as e:
+                print(f"Error polling for new usernames: {e}")
+
+
+known_users = KnownUsers()
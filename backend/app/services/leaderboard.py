@@ -0,0 +1,187 @@
+import asyncio
+import heapq
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.core.singleflight import SingleFlight
+from app.services.scores import scores
+
+RECONCILE_OVERLAP = timedelta(seconds=30)  # Re-read changes this much older than the last reconcile, for slow writes and clock skew
+INCREMENTAL_LIMIT = 64  # More changed users than this are merged by rebuilding the ranking in a thread
+RANK_CHUNK = 16384
+
+
+def sort_ranking(scores: Dict[str, int]) -> List[Tuple[int, str]]:
+    """Sort users by (-score, username).
+
+    Meant for a thread: one sort of a large list would hold the GIL for
+    seconds, so it sorts short chunks and merges them, letting the event
+    loop run in between.
+    """
+    entries = [(-score, username) for username, score in scores.items()]
+    chunks = [sorted(entries[i:i + RANK_CHUNK]) for i in range(0, len(entries), RANK_CHUNK)]
+    return list(heapq.merge(*chunks))
+
+
+def merge_ranking(ranking: List[Tuple[int, str]], changed: Dict[str, int]) -> List[Tuple[int, str]]:
+    """Return `ranking` with the users in `changed` moved to their new scores"""
+    kept = [entry for entry in ranking if entry[1] not in changed]
+    return list(heapq.merge(kept, sort_ranking(changed)))
+
+
+class Leaderboard:
+    """In-memory ranking of all users by score.
+
+    Users are kept in a list sorted by (-score, username), so rank lookups
+    are a binary search and top-N or paginated ranges are slices. It is
+    built once at startup, updated on every local score change and
+    periodically reconciled with the users whose `updated_at` moved, for
+    changes made by other workers.
+
+    Sorting a large ranking takes seconds, so bulk changes (the startup load,
+    or a reconcile with many changed users) are merged in a thread and
+    swapped in.
+    """
+
+    def __init__(self):
+        self._ranking: List[Tuple[int, str]] = []
+        self._scores: Dict[str, int] = {}
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._loads = SingleFlight("leaderboard")
+        self._merging = asyncio.Lock()
+        self._journal: Optional[Dict[str, Optional[int]]] = None  # Scores before local changes made during a merge
+        self._synced_at: Optional[datetime] = None
+        self.changed = asyncio.Event()  # Set on every change; cleared by whoever watches the ranking
+
+    def __len__(self) -> int:
+        return len(self._ranking)
+
+    def __contains__(self, username: str) -> bool:
+        return username in self._scores
+
+    async def load(self, db: AsyncIOMotorDatabase):
+        """Rebuild the ranking from the users collection; concurrent calls share one scan"""
+        await self._loads.do("users", lambda: self._load(db))
+
+    async def _load(self, db: AsyncIOMotorDatabase):
+        synced_at = datetime.now()
+        ranked = {}
+        async for user in db["users"].find({}, {"_id": 0, "username": 1, "score": 1}):
+            username = user["username"]
+            # Include score updates that are still buffered in this worker
+            ranked[username] = user.get("score", 0) + scores.pending(username)["score"]
+        await self._merge(ranked)
+        self._synced_at = synced_at
+
+    async def reconcile(self, db: AsyncIOMotorDatabase):
+        """Apply the scores of users changed since the last load or reconcile"""
+        if self._synced_at is None:
+            return await self.load(db)
+        synced_at = datetime.now()
+        changed = {}
+        query = {"updated_at": {"$gte": self._synced_at - RECONCILE_OVERLAP}}
+        async for user in db["users"].find(query, {"_id": 0, "username": 1, "score": 1}):
+            username = user["username"]
+            score = user.get("score", 0) + scores.pending(username)["score"]
+            if self._scores.get(username) != score:
+                changed[username] = score
+        if len(changed) <= INCREMENTAL_LIMIT:
+            for username, score in changed.items():
+                self._set(username, score)
+        else:
+            await self._merge(changed)
+        self._synced_at = synced_at
+
+    async def _merge(self, changed: Dict[str, int]):
+        """Move the users in `changed` to their new scores.
+
+        The new ranking is built in a thread from a copy of the current one;
+        local changes made meanwhile are then replayed onto it.
+        """
+        async with self._merging:
+            snapshot = self._ranking[:]
+            self._journal = {}
+            try:
+                # The thread only reads the copy and `changed`, which the caller no longer touches
+                ranking = await asyncio.to_thread(merge_ranking, snapshot, changed)
+            finally:
+                journal, self._journal = self._journal, None
+            for username, before in journal.items():
+                # `ranking` has this user at the `changed` score, or where the copy had it
+                merged = changed.get(username, before)
+                current = self._scores[username]
+                if username in changed:
+                    current = changed[username] + current - (before or 0)
+                if merged is not None:
+                    del ranking[bisect_left(ranking, (-merged, username))]
+                insort(ranking, (-current, username))
+                self._scores[username] = current
+            self._ranking = ranking
+            for username, score in changed.items():
+                if username not in journal:
+                    self._scores[username] = score
+            self.changed.set()
+
+    def _set(self, username: str, score: int):
+        old = self._scores.get(username)
+        if self._journal is not None:
+            self._journal.setdefault(username, old)
+        if old is not None:
+            del self._ranking[bisect_left(self._ranking, (-old, username))]
+        self._scores[username] = score
+        insort(self._ranking, (-score, username))
+        self.changed.set()
+
+    def add_user(self, username: str, score: int = 0):
+        if username not in self._scores:
+            self._set(username, score)
+
+    def add_score(self, username: str, points: int):
+        """Apply a score change for a known user"""
+        if points and username in self._scores:
+            self._set(username, self._scores[username] + points)
+
+    def rank(self, username: str) -> Optional[int]:
+        """1-based rank of a user, or None if the user is unknown"""
+        score = self._scores.get(username)
+        if score is None:
+            return None
+        return bisect_left(self._ranking, (-score, username)) + 1
+
+    def score(self, username: str) -> Optional[int]:
+        return self._scores.get(username)
+
+    def range(self, offset: int = 0, limit: int = 10) -> List[Tuple[int, str, int]]:
+        """Return (rank, username, score) tuples for a slice of the ranking"""
+        return [
+            (offset + i + 1, username, -negated_score)
+            for i, (negated_score, username) in enumerate(self._ranking[offset:offset + limit])
+        ]
+
+    def start(self, db: AsyncIOMotorDatabase, interval: float):
+        """Start reconciling with changed users every `interval` seconds"""
+        if interval > 0 and self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_loop(db, interval))
+
+    async def stop(self):
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+
+    async def _refresh_loop(self, db: AsyncIOMotorDatabase, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reconcile(db)
+            except Exception as e:
+                print(f"Error refreshing leaderboard: {e}")
+
+
+leaderboard = Leaderboard()
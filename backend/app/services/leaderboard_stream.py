@@ -0,0 +1,89 @@
+import asyncio
+import json
+from typing import Any, Dict, List, Optional
+
+from app.core.pubsub import Subscription, pubsub
+from app.services.leaderboard import leaderboard
+
+TOPIC = "leaderboard"
+
+
+def sse_frame(event: str, data: Any, event_id: Optional[int] = None) -> str:
+    frame = f"event: {event}\n"
+    if event_id is not None:
+        frame += f"id: {event_id}\n"
+    return frame + f"data: {json.dumps(data)}\n\n"
+
+
+def entry(rank: int, username: str, score: int) -> Dict[str, Any]:
+    return {"rank": rank, "username": username, "score": score}
+
+
+class LeaderboardBroadcaster:
+    """Single producer of the live top-N leaderboard.
+
+    Waits for the ranking to change, lets further changes accumulate for
+    `window` seconds, then diffs the top `size` entries against what was
+    last published and publishes the changed ranks once, as a ready-made
+    SSE frame, to every subscriber. The cost of a change doesn't depend on
+    how many streams are open.
+    """
+
+    def __init__(self, size: int = 10, window: float = 0.25, heartbeat: float = 15.0):
+        self.size = size
+        self.window = window
+        self.heartbeat = heartbeat  # Keeps idle connections open through proxies
+        self.top: List[Dict[str, Any]] = []
+        self.sequence = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self) -> Subscription:
+        """Subscribe to diffs; the returned snapshot frame is what they apply to"""
+        return pubsub.subscribe(TOPIC)
+
+    def snapshot(self) -> str:
+        return sse_frame("snapshot", {"entries": self.top}, self.sequence)
+
+    def publish_changes(self) -> bool:
+        """Publish the ranks that changed since the last call; returns whether any did"""
+        top = [entry(rank, username, score) for rank, username, score in leaderboard.range(0, self.size)]
+        changed = [new for old, new in zip(self.top, top) if old != new] + top[len(self.top):]
+        if not changed and len(top) == len(self.top):
+            return False
+        self.top = top
+        self.sequence += 1
+        pubsub.publish_raw(TOPIC, sse_frame("diff", {"entries": changed, "size": len(top)}, self.sequence))
+        return True
+
+    def start(self):
+        self.publish_changes()
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        pubsub.close_topic(TOPIC)
+
+    async def _loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(leaderboard.changed.wait(), self.heartbeat)
+            except asyncio.TimeoutError:
+                pubsub.publish_raw(TOPIC, ": keep-alive\n\n")
+                continue
+            # Coalesce: everything that changes during the window goes out in one diff
+            await asyncio.sleep(self.window)
+            leaderboard.changed.clear()
+            try:
+                self.publish_changes()
+            except Exception as e:
+                print(f"Error publishing leaderboard changes: {e}")
+
+
+leaderboard_stream = LeaderboardBroadcaster()
@@ -0,0 +1,44 @@
+from typing import Any, Dict, List
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument, UpdateOne
+
+COLLECTION = "travel_destinations"
+COUNTERS = "counters"
+
+
+async def reserve(db: AsyncIOMotorDatabase, count: int) -> int:
+    """Reserve `count` consecutive destination ordinals and return the first.
+
+    Ordinals are never reused, so a deleted destination leaves a hole rather
+    than renumbering the ones after it.
+    """
+    counter = await db[COUNTERS].find_one_and_update(
+        {"_id": COLLECTION}, {"$inc": {"next_ordinal": count}}, upsert=True, return_document=ReturnDocument.AFTER
+    )
+    return counter["next_ordinal"] - count
+
+
+async def assign(db: AsyncIOMotorDatabase, docs: List[Dict[str, Any]]):
+    """Give each document about to be inserted an ordinal"""
+    if docs:
+        first = await reserve(db, len(docs))
+        for i, doc in enumerate(docs):
+            doc["ordinal"] = first + i
+
+
+async def number_destinations(db: AsyncIOMotorDatabase) -> bool:
+    """Give destinations inserted without an ordinal one, in `_id` order; returns False on failure"""
+    try:
+        missing = await db[COLLECTION].find({"ordinal": {"$exists": False}}, {"_id": 1}).sort("_id", 1).to_list(length=None)
+        if missing:
+            first = await reserve(db, len(missing))
+            await db[COLLECTION].bulk_write([
+                UpdateOne({"_id": doc["_id"], "ordinal": {"$exists": False}}, {"$set": {"ordinal": first + i}})
+                for i, doc in enumerate(missing)
+            ], ordered=False)
+            print(f"Numbered {len(missing)} destinations.")
+        return True
+    except Exception as e:
+        print(f"Error numbering destinations: {e}")
+        return False
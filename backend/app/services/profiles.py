@@ -0,0 +1,90 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from app.core.metrics import cache_entries, cache_evictions, cache_requests
+
+CACHE_NAME = "users"
+
+
+class ProfileCache:
+    """LRU cache of user documents as stored in Mongo, with a TTL.
+
+    Reads apply unflushed score deltas on top (`scores.overlay`), so answers
+    need no cache update until they are flushed. Flushed deltas are then
+    written through to cached documents, and registrations insert theirs.
+    Changes flushed by other workers arrive as invalidations over the
+    cache channel; the TTL bounds staleness if a message is missed.
+    """
+
+    def __init__(self, capacity: int = 10000, ttl: float = 30.0):
+        self.capacity = capacity
+        self.ttl = ttl
+        # username -> (document, expiry deadline, time the read started)
+        self._entries: "OrderedDict[str, Tuple[dict, float, float]]" = OrderedDict()
+        self._last_flush = float("-inf")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, username: str) -> Optional[dict]:
+        entry = self._entries.get(username)
+        if entry is not None and entry[1] < time.monotonic():
+            self._remove(username, "expired")
+            entry = None
+        if entry is None:
+            cache_requests.inc(cache=CACHE_NAME, result="miss")
+            return None
+        cache_requests.inc(cache=CACHE_NAME, result="hit")
+        self._entries.move_to_end(username)
+        return entry[0]
+
+    def set(self, username: str, user: dict, read_started: float):
+        """Cache a user document read from Mongo at `read_started` (time.monotonic())"""
+        if read_started <= self._last_flush:
+            # A flush finished during the read: the document may or may not include it
+            return
+        self._entries[username] = (user, time.monotonic() + self.ttl, read_started)
+        self._entries.move_to_end(username)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+            cache_evictions.inc(cache=CACHE_NAME, reason="capacity")
+        cache_entries.set(len(self._entries), cache=CACHE_NAME)
+
+    def invalidate(self, username: str):
+        if username in self._entries:
+            self._remove(username, "invalidated")
+
+    def _remove(self, username: str, reason: str):
+        del self._entries[username]
+        cache_evictions.inc(cache=CACHE_NAME, reason=reason)
+        cache_entries.set(len(self._entries), cache=CACHE_NAME)
+
+    def apply_flushed(self, increments: Dict[str, Dict[str, int]], flush_started: float):
+        """Write flushed `$inc` updates through to cached documents.
+
+        A document read after the flush started may already include the
+        update, so it is dropped instead.
+        """
+        self._last_flush = time.monotonic()
+        for username, inc in increments.items():
+            entry = self._entries.get(username)
+            if entry is None:
+                continue
+            user, _, read_started = entry
+            if read_started >= flush_started:
+                self._remove(username, "invalidated")
+                continue
+            user = dict(user)
+            for field, value in inc.items():
+                user[field] = user.get(field, 0) + value
+            self._entries[username] = (user, entry[1], read_started)
+
+    def handle(self, message: dict):
+        """Apply a cache channel message from another worker"""
+        if message.get("type") == "users_changed":
+            for username in message.get("usernames", []):
+                self.invalidate(username)
+
+
+profiles = ProfileCache()
@@ -0,0 +1,489 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+from uuid import uuid4
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from app.core.channel import channel
+from app.core.http_cache import challenge_etags
+from app.core.metrics import live_connections, live_rooms
+from app.core.pubsub import Subscription, encode, pubsub
+from app.services.leaderboard import leaderboard
+from app.services.scores import answer_deltas, scores
+
+OWNERS = "live_rooms"  # Which worker holds each open room
+RELAY_TIMEOUT = 5.0  # Seconds to wait for the worker holding a room to seat a relayed player
+
+
+def room_topic(code: str) -> str:
+    return f"room:{code}"
+
+
+class RoomError(Exception):
+    """A player can't join or act in a room; `code` is the WebSocket close code"""
+
+    def __init__(self, code: int, reason: str):
+        super().__init__(reason)
+        self.code = code
+        self.reason = reason
+
+
+class Player:
+    def __init__(self, username: str):
+        self.username = username
+        self.connections = 0
+        self.score = 0
+        self.correct = 0
+        self.incorrect = 0
+        self.answers: Dict[int, bool] = {}  # Round index -> correct
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "username": self.username, "score": self.score, "correct": self.correct,
+            "incorrect": self.incorrect, "answered": len(self.answers), "connected": self.connections > 0,
+        }
+
+
+class Room:
+    """A live head-to-head game on one challenge.
+
+    All players get the same rounds; the answers and fun facts stay on the
+    server and answers are checked here.
+    """
+
+    def __init__(self, code: str, challenge_id: Any, invited: List[str], rounds: List[Dict[str, Any]],
+                 answers: List[str], fun_facts: List[str]):
+        self.code = code
+        self.challenge_id = challenge_id
+        self.invited = invited  # Usernames allowed in; the rest of the seats go to whoever joins first
+        self.rounds = rounds
+        self.answers = answers
+        self.fun_facts = fun_facts
+        self.players: Dict[str, Player] = {}
+        self.status = "waiting"
+        self.opened_at = time.monotonic()
+        self.empty_since: Optional[float] = self.opened_at  # Until someone joins
+        self.remote: Dict[str, "RemoteConnection"] = {}  # Connections held by other workers
+
+    @property
+    def topic(self) -> str:
+        return room_topic(self.code)
+
+    def state(self) -> Dict[str, Any]:
+        return {
+            "type": "state", "code": self.code, "status": self.status, "rounds": self.rounds,
+            "players": [player.summary() for player in self.players.values()],
+        }
+
+    def finished(self) -> bool:
+        return all(len(player.answers) == len(self.rounds) for player in self.players.values())
+
+
+class RemoteRoom:
+    """A room held by another worker, as seen by one connection relayed to it"""
+
+    def __init__(self, code: str, owner: str, connection: str):
+        self.code = code
+        self.owner = owner
+        self.connection = connection
+
+    @property
+    def topic(self) -> str:
+        return room_topic(self.code)
+
+
+class RemoteConnection:
+    """The room's handle on a connection held by another worker.
+
+    Messages for that connection alone are relayed to its worker over the
+    cache channel; room events reach it as `room_event` relays.
+    """
+
+    def __init__(self, registry: "RoomRegistry", worker: str, connection: str, username: str):
+        self.registry = registry
+        self.worker = worker
+        self.connection = connection
+        self.username = username
+
+    def send(self, message: dict):
+        self.registry._relay({"type": "room_send", "worker": self.worker, "connection": self.connection, "message": message})
+
+
+class RoomRegistry:
+    """Live challenge rooms in this worker.
+
+    Room events are fanned out to the players' connections through the
+    in-process pub/sub, so an update costs one publish however many
+    connections watch it. Nothing is written while a room is open: when it
+    closes, the players' answers go into the score write-behind buffer and
+    the challenge result is queued, and queued results are written in one
+    unordered bulk_write per flush.
+
+    A room lives in one worker, which holds a lease on it in the `live_rooms`
+    collection and renews it every flush. A connection that reaches another
+    worker is relayed to it over the cache channel: joins, answers and
+    leaves go to the owner, and the room's events and replies come back, in
+    order, through a single outbox. The lease of a worker that died expires
+    after `lease` seconds; its relayed connections are then closed and the
+    room can be opened elsewhere.
+    """
+
+    def __init__(self, max_players: int = 2, rounds: int = 10, grace: float = 30.0, max_age: float = 3600.0,
+                 lease: float = 30.0):
+        self.max_players = max_players
+        self.rounds = rounds
+        self.grace = grace  # How long an empty room waits for a player to reconnect
+        self.max_age = max_age
+        self.lease = lease
+        self.owner = uuid4().hex
+        self._rooms: Dict[str, Room] = {}
+        self._results: Dict[str, UpdateOne] = {}  # Challenge code -> pending result write
+        self._writing: Dict[str, UpdateOne] = {}  # Results of the flush in progress
+        self._released: Set[str] = set()  # Closed rooms whose lease is still to be dropped
+        self._relayed: Dict[str, Tuple[RemoteRoom, Subscription]] = {}  # Connections to other workers' rooms
+        self._joining: Dict[str, asyncio.Future] = {}
+        self._outbox: "asyncio.Queue[dict]" = asyncio.Queue()
+        self._db: Optional[AsyncIOMotorDatabase] = None
+        self._task: Optional[asyncio.Task] = None
+        self._relay_task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._rooms)
+
+    def get(self, code: str) -> Optional[Room]:
+        return self._rooms.get(code)
+
+    async def claim(self, code: str) -> Optional[str]:
+        """Take or renew the lease on a room and return the worker holding it.
+
+        None means the lease changed hands while it was read; try again.
+        """
+        if self._db is None:
+            return self.owner
+        now = datetime.now()
+        try:
+            # A live lease of another worker doesn't match, so the upsert hits the unique _id
+            await self._db[OWNERS].update_one(
+                {"_id": code, "$or": [{"owner": self.owner}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"owner": self.owner, "expires_at": now + timedelta(seconds=self.lease)}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            lease = await self._db[OWNERS].find_one({"_id": code}, {"owner": 1})
+            return lease["owner"] if lease else None
+        self._released.discard(code)
+        return self.owner
+
+    def played(self, code: str) -> bool:
+        """Whether a room on this challenge closed with a result not written yet"""
+        return code in self._results or code in self._writing
+
+    def _publish(self, room: Room, message: dict):
+        """Send an event to everyone in the room, here and on other workers"""
+        data = encode(message)
+        pubsub.publish_raw(room.topic, data)
+        if room.remote:
+            self._relay({"type": "room_event", "code": room.code, "data": data})
+
+    def _relay(self, message: dict):
+        self._outbox.put_nowait(message)
+
+    def handle(self, message: dict):
+        """Apply a cache channel message about a room relayed between workers"""
+        kind = message.get("type")
+        if kind in ("room_join", "room_answer", "room_leave"):
+            if message.get("owner") == self.owner:
+                self._handle_relayed(kind, message)
+        elif kind == "room_event":
+            pubsub.publish_raw(room_topic(message["code"]), message["data"])
+        elif kind == "room_closed":
+            pubsub.close_topic(room_topic(message["code"]))
+        elif kind in ("room_send", "room_joined") and message.get("worker") == self.owner:
+            if kind == "room_joined":
+                joined = self._joining.get(message["connection"])
+                if joined is not None and not joined.done():
+                    joined.set_result(message.get("error"))
+            elif message["connection"] in self._relayed:
+                self._relayed[message["connection"]][1].send(message["message"])
+
+    def _handle_relayed(self, kind: str, message: dict):
+        room = self._rooms.get(message["code"])
+        if kind == "room_join":
+            connection = RemoteConnection(self, message["worker"], message["connection"], message["username"])
+            error = None
+            try:
+                if room is None:
+                    raise RoomError(4410, "Room is closed")
+                self.join(room, connection.username, connection)
+            except RoomError as e:
+                error = [e.code, e.reason]
+            self._relay({"type": "room_joined", "worker": connection.worker, "connection": connection.connection,
+                         "error": error})
+            return
+        connection = room.remote.get(message["connection"]) if room is not None else None
+        if connection is None:
+            return  # The room closed, and its players were told
+        if kind == "room_leave":
+            self.leave(room, connection.username, connection)
+            return
+        try:
+            self.answer(room, connection.username, connection, message.get("round"), message.get("answer"))
+        except RoomError as e:
+            connection.send({"type": "error", "detail": e.reason})
+
+    def open(self, room: Room) -> Room:
+        """Register a new room, or return the one already open for its challenge"""
+        existing = self._rooms.get(room.code)
+        if existing is not None:
+            return existing
+        self._rooms[room.code] = room
+        live_rooms.set(len(self._rooms))
+        return room
+
+    def join(self, room: Room, username: str, connection: Optional[RemoteConnection] = None) -> Subscription:
+        """Seat a player (or another connection of one) and subscribe it to the room.
+
+        A `connection` held by another worker gets the room's events relayed instead.
+        """
+        if room.status == "finished":
+            raise RoomError(4410, "Room is closed")
+        player = room.players.get(username)
+        if player is None:
+            open_seats = self.max_players - len(room.players)
+            uninvited_seats = open_seats - len([u for u in room.invited if u not in room.players])
+            if open_seats <= 0 or (username not in room.invited and uninvited_seats <= 0):
+                raise RoomError(4403, "Room is full")
+            player = room.players[username] = Player(username)
+            self._publish(room, {"type": "joined", "username": username})
+        player.connections += 1
+        room.empty_since = None
+        if connection is None:
+            live_connections.inc()
+            subscription = pubsub.subscribe(room.topic)
+        else:
+            subscription = room.remote[connection.connection] = connection
+        subscription.send(room.state())
+        if room.status == "waiting" and len(room.players) == self.max_players:
+            room.status = "playing"
+            self._publish(room, {"type": "start", "players": list(room.players)})
+        return subscription
+
+    async def join_remote(self, code: str, owner: str, username: str) -> Tuple[RemoteRoom, Subscription]:
+        """Join a room held by the worker `owner` through the cache channel"""
+        room = RemoteRoom(code, owner, uuid4().hex)
+        subscription = pubsub.subscribe(room.topic)
+        self._relayed[room.connection] = (room, subscription)
+        joined = self._joining[room.connection] = asyncio.get_running_loop().create_future()
+        self._relay({"type": "room_join", "owner": owner, "code": code, "connection": room.connection,
+                     "worker": self.owner, "username": username})
+        try:
+            error = await asyncio.wait_for(joined, RELAY_TIMEOUT)
+        except asyncio.TimeoutError:
+            # In case the join arrives late, don't leave a player seated there
+            self._relay({"type": "room_leave", "owner": owner, "code": code, "connection": room.connection})
+            error = [1013, "The room did not answer"]
+        finally:
+            self._joining.pop(room.connection, None)
+        if error:
+            self._relayed.pop(room.connection, None)
+            subscription.close()
+            raise RoomError(*error)
+        live_connections.inc()
+        return room, subscription
+
+    def answer(self, room: Union[Room, RemoteRoom], username: str, subscription: Subscription, round_index: Any, answer: Any):
+        """Check a player's answer, send them the result and tell the room"""
+        if isinstance(room, RemoteRoom):
+            self._relay({"type": "room_answer", "owner": room.owner, "code": room.code, "connection": room.connection,
+                         "round": round_index, "answer": answer})
+            return
+        if room.status != "playing":
+            raise RoomError(4409, "The game has not started" if room.status == "waiting" else "The game is over")
+        if not isinstance(round_index, int) or not 0 <= round_index < len(room.rounds) or not isinstance(answer, str):
+            raise RoomError(4400, "Invalid answer")
+        player = room.players[username]
+        if round_index in player.answers:
+            raise RoomError(4409, "Round already answered")
+        correct = answer.lower() == room.answers[round_index].lower()
+        player.answers[round_index] = correct
+        deltas = answer_deltas(correct)
+        player.score += deltas.get("score", 0)
+        player.correct += deltas.get("correct_answers", 0)
+        player.incorrect += deltas.get("incorrect_answers", 0)
+        subscription.send({
+            "type": "result", "round": round_index, "correct": correct, "correct_answer": room.answers[round_index],
+            "fun_fact": room.fun_facts[round_index], "points_earned": deltas.get("score", 0),
+        })
+        # The opponent sees whether it was right but not the answer, which may be a round they haven't played yet
+        self._publish(room, {
+            "type": "answered", "username": username, "round": round_index, "correct": correct,
+            "score": player.score, "answered": len(player.answers),
+        })
+        if room.finished():
+            self.close(room)
+
+    def leave(self, room: Union[Room, RemoteRoom], username: str, subscription: Union[Subscription, RemoteConnection]):
+        if isinstance(room, RemoteRoom):
+            subscription.close()
+            live_connections.dec()
+            self._relayed.pop(room.connection, None)
+            self._relay({"type": "room_leave", "owner": room.owner, "code": room.code, "connection": room.connection})
+            return
+        if isinstance(subscription, RemoteConnection):
+            room.remote.pop(subscription.connection, None)
+        else:
+            subscription.close()
+            live_connections.dec()
+        player = room.players.get(username)
+        if player is None:
+            return
+        player.connections -= 1
+        if player.connections == 0 and room.status != "finished":
+            self._publish(room, {"type": "left", "username": username})
+        if not any(p.connections for p in room.players.values()):
+            room.empty_since = time.monotonic()
+
+    def close(self, room: Room):
+        """Close a room, record its results and end its players' subscriptions"""
+        if self._rooms.get(room.code) is not room:
+            return
+        del self._rooms[room.code]
+        self._released.add(room.code)
+        live_rooms.set(len(self._rooms))
+        completed = room.status == "playing" and room.finished()
+        room.status = "finished"
+        results = {username: player.score for username, player in room.players.items()}
+        best = max(results.values(), default=0)
+        leaders = [username for username, score in results.items() if score == best]
+        winner = leaders[0] if completed and len(leaders) == 1 else None
+        self._publish(room, {"type": "finished", "completed": completed, "results": results, "winner": winner})
+        pubsub.close_topic(room.topic)
+        if room.remote:
+            self._relay({"type": "room_closed", "code": room.code})
+
+        for username, player in room.players.items():
+            for correct in player.answers.values():
+                scores.add(username, correct)
+            leaderboard.add_score(username, player.score)
+        if len(room.players) == self.max_players and any(player.answers for player in room.players.values()):
+            # Only a pending challenge takes a result, so a replay can't overwrite a finished game
+            self._results[room.code] = UpdateOne({"_id": room.challenge_id, "status": "pending"}, {
+                "$set": {"status": "completed" if completed else "abandoned", "results": results,
+                         "winner": winner, "completed_at": datetime.now()},
+                "$inc": {"version": 1},
+            })
+
+    def sweep(self):
+        """Close rooms left empty past the grace period or open longer than max_age"""
+        now = time.monotonic()
+        for room in list(self._rooms.values()):
+            if (room.empty_since is not None and now - room.empty_since >= self.grace) or now - room.opened_at >= self.max_age:
+                self.close(room)
+
+    async def renew(self):
+        """Extend the leases of open rooms and drop those of closed ones"""
+        if self._db is None:
+            return
+        released, self._released = self._released, set()
+        try:
+            if self._rooms:
+                expires_at = datetime.now() + timedelta(seconds=self.lease)
+                await self._db[OWNERS].update_many(
+                    {"_id": {"$in": list(self._rooms)}, "owner": self.owner}, {"$set": {"expires_at": expires_at}}
+                )
+            if released:
+                await self._db[OWNERS].delete_many({"_id": {"$in": list(released)}, "owner": self.owner})
+        except Exception as e:
+            print(f"Error renewing live room leases: {e}")
+            self._released |= released - set(self._rooms)
+
+    async def check_relayed(self):
+        """Close connections relayed to rooms whose worker let the lease lapse"""
+        if self._db is None or not self._relayed:
+            return
+        codes = list({room.code for room, _ in self._relayed.values()})
+        try:
+            leases = await self._db[OWNERS].find({"_id": {"$in": codes}}).to_list(length=None)
+        except Exception as e:
+            print(f"Error checking live room leases: {e}")
+            return
+        # A missing lease is a room that closed normally; its close is on the way
+        now = datetime.now()
+        lapsed = {lease["_id"] for lease in leases if lease["expires_at"] < now}
+        holders = {lease["_id"]: lease["owner"] for lease in leases}
+        for room, subscription in list(self._relayed.values()):
+            if room.code in lapsed or holders.get(room.code, room.owner) != room.owner:
+                subscription.close()
+
+    async def flush(self):
+        """Write queued challenge results in one unordered bulk_write"""
+        if self._db is None or not self._results:
+            return
+        batch, self._results = self._results, {}
+        self._writing = batch
+        codes = list(batch)
+        try:
+            await self._db["challenges"].bulk_write([batch[code] for code in codes], ordered=False)
+        except BulkWriteError as e:
+            print(f"Error writing {len(e.details.get('writeErrors', []))} live challenge results: {e}")
+        except Exception as e:
+            print(f"Error writing live challenge results: {e}")
+            for code in codes:
+                self._results.setdefault(code, batch[code])
+        finally:
+            self._writing = {}
+        for code in codes:
+            challenge_etags.invalidate(code)
+
+    def start(self, db: AsyncIOMotorDatabase, interval: float):
+        """Start sweeping idle rooms, writing results and renewing leases every `interval` seconds"""
+        self._db = db
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop(interval))
+        if self._relay_task is None:
+            self._relay_task = asyncio.create_task(self._relay_loop())
+
+    async def stop(self):
+        """Close every room and write out the results"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for room in list(self._rooms.values()):
+            self.close(room)
+        if self._relay_task is not None:
+            self._relay_task.cancel()
+            try:
+                await self._relay_task
+            except asyncio.CancelledError:
+                pass
+            self._relay_task = None
+        # Tell other workers' players about the rooms just closed
+        while not self._outbox.empty():
+            await channel.publish(self._outbox.get_nowait())
+        await self.flush()
+        await self.renew()
+
+    async def _loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            self.sweep()
+            await self.flush()
+            await self.renew()
+            await self.check_relayed()
+
+    async def _relay_loop(self):
+        # One publish at a time, so other workers see a room's messages in order
+        while True:
+            message = await self._outbox.get()
+            await channel.publish(message)
+
+
+rooms = RoomRegistry()
@@ -0,0 +1,212 @@
+import asyncio
+import random
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from uuid import uuid4
+
+from bson import Binary
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+from app.services.catalog import catalog
+from app.services.leaderboard import leaderboard
+
+
+class SeenSet:
+    """Destinations a user has seen in the current cycle.
+
+    `bits` holds one bit per destination ordinal; ordinals are stable, so
+    the bits stay valid however the catalog changes. `unseen` is a derived
+    pool of the remaining ordinals that makes each draw O(1); it is rebuilt
+    in O(n) only once per cycle or when the catalog is reloaded other than
+    by appending.
+
+    `rev` is the stored revision the bits are based on, and `cycle` and
+    `written_cycle` tell whether a new cycle was started since then.
+    """
+
+    __slots__ = ("bits", "unseen", "positions", "generation", "rev", "cycle", "written_cycle")
+
+    def __init__(self, bits: bytes = b"", rev: Optional[str] = None):
+        self.bits = bytearray(bits)
+        self.unseen: Optional[array] = None
+        self.positions = 0
+        self.generation = -1
+        self.rev = rev
+        self.cycle = self.written_cycle = 0
+
+    def has(self, ordinal: int) -> bool:
+        byte = ordinal >> 3
+        return byte < len(self.bits) and bool(self.bits[byte] & (1 << (ordinal & 7)))
+
+    def mark(self, ordinal: int):
+        byte = ordinal >> 3
+        if byte >= len(self.bits):
+            self.bits.extend(bytes(byte + 1 - len(self.bits)))
+        self.bits[byte] |= 1 << (ordinal & 7)
+
+    def merge(self, bits: bytes):
+        """Also count the destinations seen in `bits`"""
+        if len(bits) > len(self.bits):
+            self.bits.extend(bytes(len(bits) - len(self.bits)))
+        for i, byte in enumerate(bits):
+            self.bits[i] |= byte
+        self.unseen = None
+
+    def sync(self):
+        """Make the unseen pool match the catalog"""
+        if self.unseen is None or self.generation != catalog.generation:
+            self.unseen = array("I", (o for o in catalog.ordinals() if not self.has(o)))
+        elif self.positions < len(catalog):
+            self.unseen.extend(o for o in catalog.ordinals(self.positions) if not self.has(o))
+        self.positions, self.generation = len(catalog), catalog.generation
+
+    def reset(self, keep: List[int]):
+        """Start a new cycle in which only the ordinals in `keep` count as seen"""
+        self.bits = bytearray(len(self.bits))
+        for ordinal in keep:
+            self.mark(ordinal)
+        self.unseen = None
+        self.cycle += 1
+        self.sync()
+
+    def draw(self) -> int:
+        # Swap-remove a random entry of the pool: O(1) no matter how much is seen
+        unseen = self.unseen
+        index = random.randrange(len(unseen))
+        ordinal = unseen[index]
+        unseen[index] = unseen[-1]
+        unseen.pop()
+        self.mark(ordinal)
+        return ordinal
+
+
+class NoRepeatSampler:
+    """Per-user destination sampler that never repeats within a cycle.
+
+    Seen-sets are kept in an LRU of at most `capacity` users and written to
+    the `seen_ordinals` field of the users collection, as a bitset over
+    destination ordinals, in bulk. Each write is conditional on the stored
+    `seen_rev` it was based on; when another worker wrote in between, the
+    stored bits are merged in and the write is retried on the next flush,
+    so workers drawing for the same user don't overwrite each other. A new
+    cycle started here replaces the stored bits instead.
+    """
+
+    def __init__(self, capacity: int = 10000):
+        self.capacity = capacity
+        self._seen: "OrderedDict[str, SeenSet]" = OrderedDict()
+        self._dirty: Dict[str, SeenSet] = {}  # Also keeps evicted seen-sets until they are written
+        self._db: Optional[AsyncIOMotorDatabase] = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def _get(self, db: AsyncIOMotorDatabase, username: str) -> SeenSet:
+        seen = self._seen.get(username)
+        if seen is not None:
+            self._seen.move_to_end(username)
+            return seen
+
+        seen = self._dirty.get(username)
+        if seen is None:
+            user = None
+            if username in leaderboard:
+                user = await db["users"].find_one({"username": username}, {"_id": 0, "seen_ordinals": 1, "seen_rev": 1})
+                # Another draw for this user may have loaded it while we waited
+                existing = self._seen.get(username)
+                if existing is not None:
+                    return existing
+            seen = SeenSet((user or {}).get("seen_ordinals") or b"", (user or {}).get("seen_rev"))
+        self._seen[username] = seen
+        while len(self._seen) > self.capacity:
+            self._seen.popitem(last=False)
+        return seen
+
+    async def draw(self, db: AsyncIOMotorDatabase, username: str, k: int) -> List[dict]:
+        """Return up to k destinations the user has not seen in this cycle"""
+        seen = await self._get(db, username)
+        seen.sync()
+        drawn: List[int] = []
+        for _ in range(min(k, catalog.numbered)):
+            if not seen.unseen:
+                # Everything has been seen: start over without repeating this batch
+                seen.reset(drawn)
+            drawn.append(seen.draw())
+        if drawn:
+            self._dirty[username] = seen
+        return [catalog.with_ordinal(ordinal) for ordinal in drawn]
+
+    async def flush(self):
+        """Persist changed seen-sets in a single unordered bulk_write"""
+        if self._db is None or not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        # What each write contains: draws made while it is in flight are written next time
+        writes = {username: (uuid4().hex, seen.cycle) for username, seen in dirty.items()}
+        requests = [
+            UpdateOne(
+                {"username": username, "seen_rev": seen.rev},
+                {"$set": {"seen_ordinals": Binary(bytes(seen.bits)), "seen_rev": writes[username][0]},
+                 # Earlier formats, keyed by ids or by positions that shift
+                 "$unset": {"seen_destinations": "", "seen_destination_ids": ""}},
+            )
+            for username, seen in dirty.items()
+        ]
+        try:
+            result = await self._db["users"].bulk_write(requests, ordered=False)
+            if result.matched_count < len(requests):
+                await self._resolve(dirty, writes)
+            else:
+                self._written(dirty, writes)
+        except Exception as e:
+            print(f"Error persisting seen destinations: {e}")
+            for username, seen in dirty.items():
+                self._dirty.setdefault(username, seen)
+
+    def _written(self, seen_sets: Dict[str, SeenSet], writes: Dict[str, tuple]):
+        for username, seen in seen_sets.items():
+            seen.rev, seen.written_cycle = writes[username]
+
+    async def _resolve(self, dirty: Dict[str, SeenSet], writes: Dict[str, tuple]):
+        """Sort out which writes were skipped because another worker wrote first"""
+        stored = await self._db["users"].find(
+            {"username": {"$in": list(dirty)}}, {"_id": 0, "username": 1, "seen_ordinals": 1, "seen_rev": 1}
+        ).to_list(length=None)
+        written = {}
+        for user in stored:
+            username = user["username"]
+            seen = dirty[username]
+            if user.get("seen_rev") == writes[username][0]:
+                written[username] = seen
+                continue
+            # Users missing from `stored` don't exist, so there is nothing to write for them
+            if seen.cycle == seen.written_cycle:
+                seen.merge(user.get("seen_ordinals") or b"")
+            seen.rev = user.get("seen_rev")
+            self._dirty.setdefault(username, seen)
+        self._written(written, writes)
+
+    def start(self, db: AsyncIOMotorDatabase, interval: float):
+        """Start persisting seen-sets every `interval` seconds"""
+        self._db = db
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop(interval))
+
+    async def stop(self):
+        """Stop the background flush and persist everything that changed"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+
+    async def _flush_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush()
+
+
+sampler = NoRepeatSampler()
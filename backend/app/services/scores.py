@@ -0,0 +1,146 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.core.channel import channel
+from app.services.profiles import profiles
+
+SCORE_FIELDS = ("score", "correct_answers", "incorrect_answers")
+
+
+def answer_deltas(is_correct: bool) -> Dict[str, int]:
+    return {"score": 10, "correct_answers": 1} if is_correct else {"incorrect_answers": 1}
+
+
+class ScoreAggregator:
+    """Write-behind buffer for score updates.
+
+    Answers only merge `$inc` deltas per username in memory. The deltas are
+    written as one unordered bulk_write when the buffer holds `max_pending`
+    users or every flush interval, so Mongo writes scale with flushes rather
+    than answers. Reads apply the unflushed deltas with `overlay`. Written
+    deltas are applied to the cached profiles, and other workers are told
+    to drop their copies.
+    """
+
+    def __init__(self, max_pending: int = 500):
+        self.max_pending = max_pending
+        self._pending: Dict[str, Dict[str, int]] = {}
+        self._inflight: Dict[str, Dict[str, int]] = {}
+        self._db: Optional[AsyncIOMotorDatabase] = None
+        self._lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._size_flush: Optional[asyncio.Task] = None
+
+    def add(self, username: str, is_correct: bool) -> Dict[str, int]:
+        """Record one answer for a user and return the deltas applied"""
+        deltas = answer_deltas(is_correct)
+        self._merge(self._pending, username, deltas)
+        if len(self._pending) >= self.max_pending and self._db is not None:
+            if self._size_flush is None or self._size_flush.done():
+                self._size_flush = asyncio.create_task(self.flush())
+        return deltas
+
+    @staticmethod
+    def _merge(target: Dict[str, Dict[str, int]], username: str, deltas: Dict[str, int]):
+        pending = target.setdefault(username, dict.fromkeys(SCORE_FIELDS, 0))
+        for field, value in deltas.items():
+            pending[field] += value
+
+    def pending(self, username: str) -> Dict[str, int]:
+        """Deltas for a user that have not been written to Mongo yet"""
+        totals = dict.fromkeys(SCORE_FIELDS, 0)
+        for source in (self._inflight, self._pending):
+            for field, value in source.get(username, {}).items():
+                totals[field] += value
+        return totals
+
+    @staticmethod
+    def _version_delta(deltas: Dict[str, int]) -> int:
+        return deltas.get("correct_answers", 0) + deltas.get("incorrect_answers", 0)
+
+    def overlay(self, user: dict) -> dict:
+        """Return a copy of a user document with unflushed deltas applied"""
+        deltas = self.pending(user["username"])
+        if not any(deltas.values()):
+            return user
+        user = dict(user)
+        for field, value in deltas.items():
+            user[field] = user.get(field, 0) + value
+        user["version"] = user.get("version", 0) + self._version_delta(deltas)
+        return user
+
+    async def flush(self):
+        """Write all pending deltas in a single unordered bulk_write"""
+        if self._db is None:
+            return
+        async with self._lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            self._inflight = batch
+            usernames = list(batch)
+            increments = {
+                username: {
+                    **{k: v for k, v in batch[username].items() if v},
+                    "version": self._version_delta(batch[username])
+                }
+                for username in usernames
+            }
+            # updated_at lets other workers' leaderboards pick up just the changed users
+            changed = {"updated_at": datetime.now()}
+            requests = [
+                UpdateOne({"username": username}, {"$inc": increments[username], "$set": changed}) for username in usernames
+            ]
+            started = time.monotonic()
+            written = {}
+            try:
+                await self._db["users"].bulk_write(requests, ordered=False)
+                written = increments
+            except BulkWriteError as e:
+                # Unordered writes are applied independently: only requeue the failed ones
+                failed = {usernames[error["index"]] for error in e.details.get("writeErrors", [])}
+                print(f"Error flushing {len(failed)} score updates: {e}")
+                for username in failed:
+                    self._merge(self._pending, username, batch[username])
+                written = {username: inc for username, inc in increments.items() if username not in failed}
+            except Exception as e:
+                print(f"Error flushing score updates: {e}")
+                for username, deltas in batch.items():
+                    self._merge(self._pending, username, deltas)
+            finally:
+                # Update cached profiles in the same step the deltas leave the overlay
+                profiles.apply_flushed(written, started)
+                self._inflight = {}
+        if written:
+            await channel.publish({"type": "users_changed", "usernames": list(written)})
+
+    def start(self, db: AsyncIOMotorDatabase, interval: float):
+        """Start flushing pending deltas every `interval` seconds"""
+        self._db = db
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop(interval))
+
+    async def stop(self):
+        """Stop the background flush and write out everything still pending"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+
+    async def _flush_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush()
+
+
+scores = ScoreAggregator()
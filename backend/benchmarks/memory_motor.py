@@ -0,0 +1,317 @@
+"""In-memory stand-in for the parts of Motor the API uses.
+
+Collections keep documents in process and evaluate the query and update
+operators the routers rely on. Every call counts as one Mongo round trip in
+app.core.metrics and can sleep for a simulated network latency, so request
+costs stay comparable with runs against a real server.
+"""
+import asyncio
+import copy
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, Iterable, List, Optional
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from app.core import metrics
+
+_MISSING = object()
+
+
+def _get(doc: Dict, field: str) -> Any:
+    value = doc
+    for part in field.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _compare(value: Any, op: str, operand: Any) -> bool:
+    if op == "$eq":
+        return value == operand
+    if op == "$ne":
+        return value != operand or value is _MISSING
+    if op == "$in":
+        return value in operand
+    if op == "$nin":
+        return value not in operand
+    if op == "$exists":
+        return (value is not _MISSING) == bool(operand)
+    if value is _MISSING or value is None:
+        return False
+    if op == "$lt":
+        return value < operand
+    if op == "$lte":
+        return value <= operand
+    if op == "$gt":
+        return value > operand
+    if op == "$gte":
+        return value >= operand
+    raise NotImplementedError(f"Query operator {op} is not supported")
+
+
+def matches(doc: Dict, query: Dict) -> bool:
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+        elif key == "$and":
+            if not all(matches(doc, sub) for sub in condition):
+                return False
+        elif isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+            value = _get(doc, key)
+            if not all(_compare(value, op, operand) for op, operand in condition.items()):
+                return False
+        else:
+            value = _get(doc, key)
+            if value is _MISSING:
+                if condition is not None:
+                    return False
+            elif value != condition:
+                return False
+    return True
+
+
+def project(doc: Dict, projection: Optional[Dict]) -> Dict:
+    if not projection:
+        return copy.deepcopy(doc)
+    include_id = projection.get("_id", 1)
+    fields = {k: v for k, v in projection.items() if k != "_id"}
+    if fields and all(fields.values()):
+        result = {k: copy.deepcopy(doc[k]) for k in fields if k in doc}
+    else:
+        result = {k: copy.deepcopy(v) for k, v in doc.items() if k not in fields}
+    if include_id and "_id" in doc:
+        result["_id"] = doc["_id"]
+    else:
+        result.pop("_id", None)
+    return result
+
+
+def apply_update(doc: Dict, update: Dict, inserting: bool = False):
+    for op, fields in update.items():
+        for field, value in fields.items():
+            if op == "$set" or (op == "$setOnInsert" and inserting):
+                doc[field] = copy.deepcopy(value)
+            elif op == "$inc":
+                doc[field] = doc.get(field, 0) + value
+            elif op == "$unset":
+                doc.pop(field, None)
+            elif op == "$addToSet":
+                values = doc.setdefault(field, [])
+                for item in value["$each"] if isinstance(value, dict) and "$each" in value else [value]:
+                    if item not in values:
+                        values.append(copy.deepcopy(item))
+            elif op != "$setOnInsert":
+                raise NotImplementedError(f"Update operator {op} is not supported")
+
+
+def _sort_key(value: Any):
+    # Missing and None sort first, as in Mongo
+    return (0, 0) if value is _MISSING or value is None else (1, value)
+
+
+class MemoryCursor:
+    def __init__(self, collection: "MemoryCollection", query: Dict, projection: Optional[Dict]):
+        self._collection = collection
+        self._query = query
+        self._projection = projection
+        self._sort: List = []
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key, direction: int = 1):
+        self._sort = list(key) if isinstance(key, list) else [(key, direction)]
+        return self
+
+    def skip(self, count: int):
+        self._skip = count
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    def _results(self) -> List[Dict]:
+        docs = [doc for doc in self._collection._docs.values() if matches(doc, self._query)]
+        for field, direction in reversed(self._sort):
+            docs.sort(key=lambda doc: _sort_key(_get(doc, field)), reverse=direction < 0)
+        docs = docs[self._skip:]
+        if self._limit:
+            docs = docs[:self._limit]
+        return [project(doc, self._projection) for doc in docs]
+
+    async def to_list(self, length: Optional[int] = None) -> List[Dict]:
+        await self._collection._round_trip("find")
+        docs = self._results()
+        return docs[:length] if length is not None else docs
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in await self.to_list(None):
+            yield doc
+
+
+class MemoryCollection:
+    def __init__(self, database: "MemoryDatabase", name: str):
+        self.database = database
+        self.name = name
+        self._docs: Dict[Any, Dict] = {}
+        self._unique: Dict[str, List[str]] = {}
+        self._partial: set = set()
+
+    async def _round_trip(self, command: str):
+        metrics.record_round_trip()
+        start = time.perf_counter()
+        if self.database.latency:
+            await asyncio.sleep(self.database.latency)
+        metrics.mongo_command_duration.observe(time.perf_counter() - start, collection=self.name, command=command)
+
+    def _check_unique(self, doc: Dict, ignore_id: Any = None):
+        for name, fields in self._unique.items():
+            key = tuple(_get(doc, f) for f in fields)
+            if name in self._partial and _MISSING in key:
+                continue
+            for other in self._docs.values():
+                if other["_id"] != ignore_id and tuple(_get(other, f) for f in fields) == key:
+                    raise DuplicateKeyError(f"E11000 duplicate key error index: {name}", 11000)
+
+    def _insert(self, doc: Dict):
+        doc.setdefault("_id", ObjectId())
+        self._check_unique(doc)
+        self._docs[doc["_id"]] = copy.deepcopy(doc)
+
+    async def create_index(self, keys, unique: bool = False, name: Optional[str] = None, **kwargs) -> str:
+        await self._round_trip("createIndexes")
+        name = name or "_".join(f"{field}_{direction}" for field, direction in keys)
+        if unique:
+            self._unique[name] = [field for field, _ in keys]
+            # Only `$exists` partial filters are used, which the missing-field check covers
+            if kwargs.get("sparse") or kwargs.get("partialFilterExpression"):
+                self._partial.add(name)
+        return name
+
+    def find(self, query: Optional[Dict] = None, projection: Optional[Dict] = None) -> MemoryCursor:
+        return MemoryCursor(self, query or {}, projection)
+
+    async def find_one(self, query: Optional[Dict] = None, projection: Optional[Dict] = None) -> Optional[Dict]:
+        docs = await self.find(query, projection).limit(1).to_list(1)
+        return docs[0] if docs else None
+
+    async def estimated_document_count(self) -> int:
+        await self._round_trip("count")
+        return len(self._docs)
+
+    async def count_documents(self, query: Dict) -> int:
+        await self._round_trip("count")
+        return sum(1 for doc in self._docs.values() if matches(doc, query))
+
+    async def insert_one(self, doc: Dict):
+        await self._round_trip("insert")
+        self._insert(doc)
+        return SimpleNamespace(inserted_id=doc["_id"])
+
+    async def insert_many(self, docs: Iterable[Dict], ordered: bool = True):
+        await self._round_trip("insert")
+        inserted, errors = [], []
+        for index, doc in enumerate(docs):
+            try:
+                self._insert(doc)
+                inserted.append(doc["_id"])
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(inserted)})
+        return SimpleNamespace(inserted_ids=inserted)
+
+    async def delete_many(self, query: Dict):
+        await self._round_trip("delete")
+        deleted = [key for key, doc in self._docs.items() if matches(doc, query)]
+        for key in deleted:
+            del self._docs[key]
+        return SimpleNamespace(deleted_count=len(deleted))
+
+    def _update(self, query: Dict, update: Dict, upsert: bool, multi: bool):
+        matched = [doc for doc in self._docs.values() if matches(doc, query)]
+        if not multi:
+            matched = matched[:1]
+        for doc in matched:
+            updated = copy.deepcopy(doc)
+            apply_update(updated, update)
+            self._check_unique(updated, ignore_id=doc["_id"])
+            doc.clear()
+            doc.update(updated)
+        upserted_id = None
+        if not matched and upsert:
+            doc = {k: v for k, v in query.items() if not k.startswith("$") and not isinstance(v, dict)}
+            apply_update(doc, update, inserting=True)
+            self._insert(doc)
+            upserted_id = doc["_id"]
+        return SimpleNamespace(matched_count=len(matched), modified_count=len(matched), upserted_id=upserted_id)
+
+    async def update_one(self, query: Dict, update: Dict, upsert: bool = False):
+        await self._round_trip("update")
+        return self._update(query, update, upsert, multi=False)
+
+    async def update_many(self, query: Dict, update: Dict, upsert: bool = False):
+        await self._round_trip("update")
+        return self._update(query, update, upsert, multi=True)
+
+    async def find_one_and_update(self, query: Dict, update: Dict, projection: Optional[Dict] = None,
+                                  upsert: bool = False, return_document: bool = ReturnDocument.BEFORE, **kwargs):
+        await self._round_trip("findAndModify")
+        before = next((copy.deepcopy(doc) for doc in self._docs.values() if matches(doc, query)), None)
+        result = self._update(query, update, upsert, multi=False)
+        if return_document == ReturnDocument.AFTER:
+            key = before["_id"] if before else result.upserted_id
+            after = self._docs.get(key)
+            return project(after, projection) if after else None
+        return project(before, projection) if before else None
+
+    async def bulk_write(self, requests: List, ordered: bool = True):
+        await self._round_trip("bulkWrite")
+        errors, counts = [], {"nMatched": 0, "nModified": 0, "nUpserted": 0, "nInserted": 0}
+        for index, request in enumerate(requests):
+            try:
+                if hasattr(request, "_filter"):
+                    result = self._update(request._filter, request._doc, bool(request._upsert),
+                                          multi=type(request).__name__ == "UpdateMany")
+                    counts["nMatched"] += result.matched_count
+                    counts["nModified"] += result.modified_count
+                    counts["nUpserted"] += int(result.upserted_id is not None)
+                else:
+                    self._insert(request._doc)
+                    counts["nInserted"] += 1
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, **counts})
+        return SimpleNamespace(
+            matched_count=counts["nMatched"], modified_count=counts["nModified"],
+            upserted_count=counts["nUpserted"], inserted_count=counts["nInserted"]
+        )
+
+
+class MemoryDatabase:
+    def __init__(self, name: str = "destinations", latency: float = 0.0):
+        self.name = name
+        self.latency = latency
+        self._collections: Dict[str, MemoryCollection] = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        if name not in self._collections:
+            self._collections[name] = MemoryCollection(self, name)
+        return self._collections[name]
+
+    async def command(self, command, *args, **kwargs) -> Dict:
+        metrics.record_round_trip()
+        return {"ok": 1}
@@ -0,0 +1,247 @@
+"""Replay game sessions against the API in-process and report per-endpoint costs.
+
+Usage (from the backend directory):
+
+    python -m benchmarks.run                         # in-memory Motor stand-in
+    python -m benchmarks.run --mongo-uri mongodb://localhost:27017
+    python -m benchmarks.run --compare benchmarks/results/previous.json
+
+Each virtual player registers, plays a number of rounds (fetch a random
+destination, answer it), views the leaderboard and their profile, creates a
+challenge and opens it twice, the second time revalidating with its ETag.
+Results are written as JSON so runs can be compared.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+from app.core import metrics  # noqa: E402
+from app.db import database  # noqa: E402
+
+BENCH_DB_NAME = "globetrotter_bench"
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def synthetic_destinations(count: int, seed: int) -> List[Dict]:
+    """Destinations shaped like destinations_example.json, with varied text"""
+    rng = random.Random(seed)
+    words = ("river tower bridge royal bell market temple desert harbour mountain canal palace opera "
+             "island museum garden castle cathedral square festival spice silk tram lagoon").split()
+    return [
+        {
+            "name": f"City {i}",
+            "alias": f"bench{i:05d}",
+            "clues": [" ".join(rng.choices(words, k=10)) for _ in range(5)],
+            "fun_facts": [" ".join(rng.choices(words, k=16)) for _ in range(5)],
+            "difficulty": "medium",
+            "created_at": datetime.utcnow(),
+        }
+        for i in range(count)
+    ]
+
+
+ROUND_TRIP_HEADER = "X-Mongo-Round-Trips"
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.round_trips: Dict[str, List[int]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.routes: Dict[str, tuple] = {}
+
+    async def call(self, client: httpx.AsyncClient, name: str, method: str, route: str, url: str, **kwargs):
+        self.routes[name] = (method, route)
+        start = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self.latencies[name].append(time.perf_counter() - start)
+        # Counted per step: steps sharing a route (open vs revalidate) can cost very differently
+        self.round_trips[name].append(int(response.headers.get(ROUND_TRIP_HEADER, 0)))
+        if response.status_code >= 400:
+            self.errors[name] += 1
+        return response
+
+
+async def play_session(client: httpx.AsyncClient, recorder: Recorder, player: int, rounds: int, rng: random.Random):
+    username = f"bench_player_{player}"
+    await recorder.call(client, "register", "POST", "/api/users/auth", "/api/users/auth", json={"username": username})
+    for _ in range(rounds):
+        response = await recorder.call(
+            client, "random", "GET", "/api/destinations/random", "/api/destinations/random",
+            headers={"X-Username": username}
+        )
+        if response.status_code != 200:
+            continue
+        round_data = response.json()
+        await recorder.call(client, "answer", "POST", "/api/destinations/answer", "/api/destinations/answer", json={
+            "destination_id": round_data["destination_id"],
+            "user_answer": rng.choice(round_data["options"]),
+            "username": username,
+            "round_token": round_data.get("round_token"),
+        })
+    await recorder.call(client, "leaderboard", "GET", "/api/users/leaderboard", "/api/users/leaderboard")
+    await recorder.call(client, "profile", "GET", "/api/users/{username}", f"/api/users/{username}")
+    response = await recorder.call(
+        client, "create_challenge", "POST", "/api/challenges/", "/api/challenges/",
+        json={"challenger_username": username}
+    )
+    if response.status_code == 200:
+        code = response.json()["challenge_code"]
+        opened = await recorder.call(
+            client, "open_challenge", "GET", "/api/challenges/{challenge_code}", f"/api/challenges/{code}"
+        )
+        etag = opened.headers.get("etag")
+        await recorder.call(
+            client, "revalidate_challenge", "GET", "/api/challenges/{challenge_code}", f"/api/challenges/{code}",
+            headers={"If-None-Match": etag} if etag else {}
+        )
+
+
+async def run_benchmark(args) -> Dict:
+    if args.mongo_uri:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        client = AsyncIOMotorClient(args.mongo_uri, event_listeners=[metrics.mongo_listener])
+        await client.drop_database(BENCH_DB_NAME)
+        database.db = client[BENCH_DB_NAME]
+    else:
+        from benchmarks.memory_motor import MemoryDatabase
+        database.db = MemoryDatabase(latency=args.latency_ms / 1000)
+
+    metrics.round_trip_header = ROUND_TRIP_HEADER
+    # Imported after the database is swapped so the app binds to it
+    from app.main import app
+
+    await database.db["travel_destinations"].insert_many(synthetic_destinations(args.destinations, args.seed))
+
+    recorder = Recorder()
+    rng = random.Random(args.seed)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def session(player: int):
+        async with semaphore:
+            await play_session(http, recorder, player, args.rounds, random.Random(rng.random()))
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+            start = time.perf_counter()
+            await asyncio.gather(*(session(player) for player in range(args.players)))
+            elapsed = time.perf_counter() - start
+
+    if args.mongo_uri:
+        await client.drop_database(BENCH_DB_NAME)
+        client.close()
+
+    endpoints = {}
+    for name, latencies in recorder.latencies.items():
+        latencies.sort()
+        method, route = recorder.routes[name]
+        round_trips = recorder.round_trips[name]
+        endpoints[name] = {
+            "route": f"{method} {route}",
+            "requests": len(latencies),
+            "errors": recorder.errors[name],
+            "mean_ms": 1000 * sum(latencies) / len(latencies),
+            "p50_ms": 1000 * percentile(latencies, 0.50),
+            "p95_ms": 1000 * percentile(latencies, 0.95),
+            "p99_ms": 1000 * percentile(latencies, 0.99),
+            "mongo_round_trips_per_request": sum(round_trips) / len(round_trips),
+        }
+    total = sum(len(latencies) for latencies in recorder.latencies.values())
+    return {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "backend": "mongo" if args.mongo_uri else "memory",
+            "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare", "mongo_uri")},
+        },
+        "totals": {"requests": total, "seconds": elapsed, "throughput_rps": total / elapsed if elapsed else 0.0},
+        "endpoints": endpoints,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(results: Dict, baseline: Optional[Dict] = None):
+    totals = results["totals"]
+    print(f"{totals['requests']} requests in {totals['seconds']:.2f}s ({totals['throughput_rps']:.1f} req/s)")
+    header = f"{'endpoint':<22}{'reqs':>7}{'err':>5}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'mongo/req':>11}"
+    print(header)
+    print("-" * len(header))
+    for name, stats in results["endpoints"].items():
+        line = (f"{name:<22}{stats['requests']:>7}{stats['errors']:>5}{stats['p50_ms']:>9.2f}"
+                f"{stats['p95_ms']:>9.2f}{stats['p99_ms']:>9.2f}{stats['mongo_round_trips_per_request']:>11.2f}")
+        previous = (baseline or {}).get("endpoints", {}).get(name)
+        if previous:
+            line += (f"   p50 {_delta(stats['p50_ms'], previous['p50_ms'])}"
+                     f" p99 {_delta(stats['p99_ms'], previous['p99_ms'])}"
+                     f" mongo {stats['mongo_round_trips_per_request'] - previous['mongo_round_trips_per_request']:+.2f}")
+        print(line)
+    if baseline:
+        before = baseline["totals"]["throughput_rps"]
+        print(f"throughput {_delta(totals['throughput_rps'], before)} vs {baseline['meta'].get('git_commit')}")
+
+
+def _delta(current: float, previous: float) -> str:
+    return f"{(current - previous) / previous * 100:+.1f}%" if previous else "n/a"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Globetrotter API with simulated game sessions")
+    parser.add_argument("--players", type=int, default=200, help="Number of simulated players")
+    parser.add_argument("--rounds", type=int, default=10, help="Rounds played per player")
+    parser.add_argument("--concurrency", type=int, default=50, help="Players active at the same time")
+    parser.add_argument("--destinations", type=int, default=500, help="Destinations seeded into the catalog")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--latency-ms", type=float, default=1.0,
+                        help="Simulated Mongo round-trip latency for the in-memory stand-in")
+    parser.add_argument("--mongo-uri", help="Run against a real Mongo server (uses a throwaway database)")
+    parser.add_argument("--out", help="Results file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    results = asyncio.run(run_benchmark(args))
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    print_report(results, baseline)
+
+    out = Path(args.out) if args.out else (
+        BACKEND_DIR / "benchmarks" / "results" / f"{datetime.utcnow():%Y%m%dT%H%M%S}.json"
+    )
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(results, indent=2))
+    print(f"Results written to {os.path.relpath(out)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,49 @@
+import argparse
+import importlib.util
+import os
+
 import uvicorn
 
-from app.main import app
+from app.core.config import settings
+
+
+def available_cpus() -> int:
+    # Respect CPU affinity (containers) where the platform exposes it
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def production_options() -> dict:
+    options = {
+        "workers": settings.WEB_CONCURRENCY or available_cpus(),
+        "backlog": settings.SERVER_BACKLOG,
+        "timeout_keep_alive": settings.SERVER_KEEP_ALIVE_SECONDS,
+        "proxy_headers": True,
+        "forwarded_allow_ips": "*",
+    }
+    # Prefer the faster event loop and HTTP parser when they are installed
+    if importlib.util.find_spec("uvloop"):
+        options["loop"] = "uvloop"
+    if importlib.util.find_spec("httptools"):
+        options["http"] = "httptools"
+    return options
+
 
 if __name__ == "__main__":
-    uvicorn.run(app="app.main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the Globetrotter API")
+    parser.add_argument("--production", action="store_true", help="Run multiple workers without auto-reload")
+    args = parser.parse_args()
+
+    if args.production:
+        options = production_options()
+        if options["workers"] > 1 and "CACHE_CHANNEL" not in os.environ:
+            # Workers cache profiles and known usernames in memory; without a
+            # shared channel their invalidations never reach each other.
+            # Worker processes read their settings from this environment.
+            os.environ["CACHE_CHANNEL"] = "mongo"
+        elif options["workers"] > 1 and settings.CACHE_CHANNEL != "mongo":
+            print(f"Warning: CACHE_CHANNEL={settings.CACHE_CHANNEL} with {options['workers']} workers; caches will go stale")
+        uvicorn.run(app="app.main:app", host="0.0.0.0", port=settings.PORT, **options)
+    else:
+        uvicorn.run(app="app.main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,53 @@
+import argparse
+import os
+import sys
+
+from pymongo import MongoClient
+from dotenv import load_dotenv
+
+# The snapshot format lives with the backend so the app and this script always agree on it
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from app.services.catalog_snapshot import read_snapshot, write_snapshot  # noqa: E402
+
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGO_DB_URI")
+
+# Database and collection names
+DB_NAME = "destinations"
+COLLECTION_NAME = "travel_destinations"
+
+
+def build_snapshot(mongo_uri: str, output: str):
+    """
+    Writes the destination collection to a catalog snapshot file.
+
+    Deploy the file with the backend and point CATALOG_SNAPSHOT_PATH at it so
+    new instances load the catalog without querying MongoDB.
+
+    Args:
+        mongo_uri: The MongoDB connection string.
+        output: Path of the snapshot file to write.
+    """
+    client = MongoClient(mongo_uri)
+    try:
+        collection = client[DB_NAME][COLLECTION_NAME]
+        docs = list(collection.find({}, {"ordinal": 1, "name": 1, "alias": 1, "clues": 1, "fun_facts": 1}).sort("_id", 1))
+    finally:
+        client.close()
+
+    digest = write_snapshot(output, docs)
+    # Read it back so a bad file never gets deployed
+    read_snapshot(output)
+    print(f"Wrote {len(docs)} destinations to {output} (sha256 {digest}).")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a destination catalog snapshot from MongoDB")
+    parser.add_argument("--output", default="catalog.snapshot", help="Snapshot file to write")
+    args = parser.parse_args()
+
+    if not MONGO_URI:
+        print("MONGO_DB_URI environment variable not set.")
+    else:
+        build_snapshot(MONGO_URI, args.output)
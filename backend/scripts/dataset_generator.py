@@ -2,12 +2,15 @@ import os
 import json
 import time
 import random
-import openai
-import google.generativeai as genai
-import groq
-from typing import List, Dict, Any
+import asyncio
+import argparse
+import hashlib
+from abc import ABC, abstractmethod
+from typing import List, Dict, Any, Iterable, Optional, Set
 from dotenv import load_dotenv
 import logging
+from llm_cache import LLMCache, cache_key
+from dedup import dedupe_catalog, dedupe_texts
 
 load_dotenv()
 
@@ -15,10 +18,13 @@ load_dotenv()
 logging.basicConfig(filename='api_calls.log', level=logging.DEBUG,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Set API keys (Ensure they are set as environment variables)
-openai.api_key = os.getenv("OPENAI_API_KEY")
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-groq_client = groq.Client(api_key=os.getenv("GROQ_API_KEY"))
+# Per-provider limits: sustained requests per minute, burst size and requests in flight.
+# The defaults match the free tiers; raise them with the environment variables on paid plans.
+PROVIDER_LIMITS = {
+    "openai": (float(os.getenv("OPENAI_RPM", "60")), 5, 8),
+    "gemini": (float(os.getenv("GEMINI_RPM", "15")), 3, 4),
+    "groq": (float(os.getenv("GROQ_RPM", "30")), 3, 4),
+}
 
 # List of cities (you can expand this)
 cities = [
@@ -55,48 +61,215 @@ class Destination:
             "fun_facts": self.fun_facts
         }
 
-# Function to handle API retries
-def fetch_with_retries(api_func, city_name: str, max_retries=3):
-    for attempt in range(max_retries):
+
+def empty_result() -> Dict[str, List[str]]:
+    return {"clues": [], "fun_facts": []}
+
+
+def city_alias(city_name: str) -> str:
+    # Derived from the name so reruns produce the same alias and 10,000 cities don't collide
+    return f"dst{hashlib.sha1(city_name.encode()).hexdigest()[:10]}"
+
+
+class RateLimited(Exception):
+    """A provider rejected a request for exceeding its rate limit"""
+
+    def __init__(self, retry_after: Optional[float] = None):
+        super().__init__(f"rate limited (retry after {retry_after}s)" if retry_after is not None else "rate limited")
+        self.retry_after = retry_after
+
+
+def retry_after_header(error: Exception) -> Optional[float]:
+    """Read the Retry-After header from an SDK error's HTTP response, if it has one"""
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers["retry-after"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Hands out `rate` tokens per second on average, with bursts of up to `capacity`.
+
+    Waiters are served in arrival order. After a rate-limit error the bucket
+    is paused so every pending request for that provider backs off together.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+        self.updated = self.paused_until
+
+
+class Provider(ABC):
+    """An LLM that returns clues and fun facts for a city, behind its own rate limiter"""
+
+    name = "provider"
+    model = ""
+    temperature: Optional[float] = None
+
+    def __init__(self, requests_per_minute: float, burst: int, max_in_flight: int):
+        self.bucket = TokenBucket(requests_per_minute / 60, burst)
+        self.in_flight = asyncio.Semaphore(max_in_flight)
+
+    def prompt(self, city_name: str) -> str:
+        return f"Provide 5 cryptic clues and 5 fun facts about {city_name} in JSON format. Return ONLY the JSON, without any surrounding text or backticks."
+
+    @abstractmethod
+    async def fetch(self, city_name: str) -> Dict[str, List[str]]:
+        """Return {"clues": [...], "fun_facts": [...]} for a city"""
+
+
+class OpenAIProvider(Provider):
+    name = "openai"
+    model = "gpt-3.5-turbo"
+    temperature = 0.7
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        import openai
+        self.errors = openai
+        self.client = openai.AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+    def prompt(self, city_name: str) -> str:
+        return f"Provide 5 cryptic clues and 5 fun facts about {city_name} in JSON format."
+
+    async def fetch(self, city_name: str) -> Dict[str, List[str]]:
+        prompt = self.prompt(city_name)
+        logging.info(f"OpenAI prompt: {prompt}")
         try:
-            return api_func(city_name)
-        except openai.RateLimitError:
-            print(f"Rate limit reached for OpenAI on attempt {attempt + 1}. Retrying...")
-            logging.warning(f"Rate limit reached for OpenAI on attempt {attempt + 1}. Retrying...")
-        except Exception as e:
-            print(f"API error: {e}. Retrying in {2**attempt} seconds...")
-            logging.exception(f"API error on attempt {attempt + 1}: {e}. Retrying in {2**attempt} seconds...")
-        time.sleep(2**attempt)  # Exponential backoff
-    print(f"Failed to fetch data for {city_name} after {max_retries} attempts.")
-    logging.error(f"Failed to fetch data for {city_name} after {max_retries} attempts.")
-    return {"clues": [], "fun_facts": []}  # Return empty fallback
-
-# Function to generate data using OpenAI
-def get_openai_data(city_name: str) -> Dict[str, List[str]]:
-    prompt = f"Provide 5 cryptic clues and 5 fun facts about {city_name} in JSON format."
-    logging.info(f"OpenAI prompt: {prompt}")
-    response = openai.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": "You are a travel expert and quiz creator."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.7,
-    )
-    logging.info(f"OpenAI raw response: {response}")
-    return json.loads(response.choices[0].message.content)
-
-# Function to generate data using Google Gemini AI
-def get_gemini_data(city_name: str) -> Dict[str, List[str]]:
-    prompt = f"Provide 5 cryptic clues and 5 fun facts about {city_name} in JSON format. Return ONLY the JSON, without any surrounding text or backticks."
-    logging.info(f"Gemini prompt: {prompt}")
-    model = genai.GenerativeModel("gemini-2.0-flash")
-    response = model.generate_content(prompt)
-    logging.info(f"Gemini raw response: {response.text}")
-    if response.text:
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": "You are a travel expert and quiz creator."},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=self.temperature,
+            )
+        except self.errors.RateLimitError as e:
+            raise RateLimited(retry_after_header(e))
+        logging.info(f"OpenAI raw response: {response}")
+        data = json.loads(response.choices[0].message.content)
+        return {"clues": data.get("clues", []), "fun_facts": data.get("fun_facts", [])}
+
+
+class GeminiProvider(Provider):
+    name = "gemini"
+    model = "gemini-2.0-flash"
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        import google.generativeai as genai
+        from google.api_core import exceptions
+        self.errors = exceptions
+        genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+        self.client = genai.GenerativeModel(self.model)
+
+    async def fetch(self, city_name: str) -> Dict[str, List[str]]:
+        prompt = self.prompt(city_name)
+        logging.info(f"Gemini prompt: {prompt}")
+        try:
+            response = await self.client.generate_content_async(prompt)
+        except (self.errors.ResourceExhausted, self.errors.TooManyRequests) as e:
+            raise RateLimited(retry_after_header(e))
+        logging.info(f"Gemini raw response: {response.text}")
+        return parse_gemini_response(response.text, city_name)
+
+
+class GroqProvider(Provider):
+    name = "groq"
+    model = "llama3-70b-8192"
+    temperature = 0.7
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        import groq
+        self.errors = groq
+        self.client = groq.AsyncGroq(api_key=os.getenv("GROQ_API_KEY"))
+
+    async def fetch(self, city_name: str) -> Dict[str, List[str]]:
+        prompt = self.prompt(city_name)
+        logging.info(f"Groq prompt: {prompt}")
+        try:
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": "You are a travel expert and quiz creator."},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=self.temperature,
+            )
+        except self.errors.RateLimitError as e:
+            raise RateLimited(retry_after_header(e))
+        logging.info(f"Groq raw response: {response}")
+        return parse_groq_response(response, city_name)
+
+
+STAND_IN_WORDS = (
+    "ancient harbour river tower bridge market palace cathedral museum garden square festival "
+    "mountain island canal temple castle fortress skyline tram opera library desert coast "
+    "spice silk royal famous hidden golden northern southern eastern western oldest largest "
+    "busiest tallest narrow winding colourful quiet lively historic modern floating painted"
+).split()
+
+
+class StandInProvider(Provider):
+    """Offline provider returning canned clues after a simulated delay.
+
+    It rate-limits a fraction of requests so retries and backoff can be
+    exercised without API keys.
+    """
+
+    model = "standin"
+
+    def __init__(self, name: str, latency: float = 0.05, rate_limit_ratio: float = 0.05):
+        super().__init__(60000, 100, 64)
+        self.name = name
+        self.latency = latency
+        self.rate_limit_ratio = rate_limit_ratio
+
+    async def fetch(self, city_name: str) -> Dict[str, List[str]]:
+        await asyncio.sleep(random.uniform(0.5, 1.5) * self.latency)
+        if random.random() < self.rate_limit_ratio:
+            raise RateLimited(retry_after=self.latency)
+        # Seeded per city and provider so reruns return the same text
+        rng = random.Random(f"{self.name}:{city_name}")
+        return {
+            "clues": [" ".join(rng.choices(STAND_IN_WORDS, k=10)) for _ in range(3)],
+            "fun_facts": [" ".join(rng.choices(STAND_IN_WORDS, k=14)) for _ in range(3)],
+        }
+
+
+PROVIDERS = {"openai": OpenAIProvider, "gemini": GeminiProvider, "groq": GroqProvider}
+
+
+def parse_gemini_response(text: str, city_name: str) -> Dict[str, List[str]]:
+    if text:
         try:
             # Extract JSON string from within backticks
-            json_string = response.text.strip().removeprefix("```json").removesuffix("```").strip()
+            json_string = text.strip().removeprefix("```json").removesuffix("```").strip()
 
             logging.info(f"Extracted JSON string: {json_string}")
 
@@ -105,7 +278,7 @@ def get_gemini_data(city_name: str) -> Dict[str, List[str]]:
             if not json_string:
                 print(f"Warning: Gemini returned an empty JSON string for {city_name}.")
                 logging.warning(f"Gemini returned an empty JSON string for {city_name}.")
-                return {"clues": [], "fun_facts": []}
+                return empty_result()
 
             data = json.loads(json_string)
 
@@ -117,26 +290,14 @@ def get_gemini_data(city_name: str) -> Dict[str, List[str]]:
         except (json.JSONDecodeError, KeyError, TypeError) as e:
             print(f"Error processing Gemini response: {e}")
             logging.error(f"Error processing Gemini response: {e}")
-            return {"clues": [], "fun_facts": []}
+            return empty_result()
     else:
         print(f"Warning: Gemini returned an empty response for {city_name}.")
         logging.warning(f"Gemini returned an empty response for {city_name}.")
-        return {"clues": [], "fun_facts": []}  # Return empty fallback
-
-# Function to generate data using Groq AI
-def get_groq_data(city_name: str) -> Dict[str, List[str]]:
-    prompt = f"Provide 5 cryptic clues and 5 fun facts about {city_name} in JSON format. Return ONLY the JSON, without any surrounding text or backticks."
-    logging.info(f"Groq prompt: {prompt}")
-    response = groq_client.chat.completions.create(
-        model="llama3-70b-8192",
-        messages=[
-            {"role": "system", "content": "You are a travel expert and quiz creator."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.7,
-    )
-    logging.info(f"Groq raw response: {response}")
+        return empty_result()  # Return empty fallback
 
+
+def parse_groq_response(response, city_name: str) -> Dict[str, List[str]]:
     try:
         # Extract the content string
         content = response.choices[0].message.content
@@ -155,7 +316,7 @@ def get_groq_data(city_name: str) -> Dict[str, List[str]]:
         if not json_string:
             print(f"Warning: Groq returned an empty JSON string for {city_name}.")
             logging.warning(f"Groq returned an empty JSON string for {city_name}.")
-            return {"clues": [], "fun_facts": []}
+            return empty_result()
 
         data = json.loads(json_string)
 
@@ -167,53 +328,195 @@ def get_groq_data(city_name: str) -> Dict[str, List[str]]:
     except (json.JSONDecodeError, KeyError, TypeError, AttributeError) as e:
         print(f"Error processing Groq response: {e}")
         logging.error(f"Error processing Groq response: {e}")
-        return {"clues": [], "fun_facts": []}
-
-# Function to generate data from all three LLMs
-def generate_destination_data(city_name: str) -> Destination:
-    print(f"Generating data for {city_name}...")
-
-    # Random alias
-    alias = f"dst{random.randint(1000, 9999)}"
-
-    # Get data from different models with retries
-    # openai_data = fetch_with_retries(get_openai_data, city_name)
-    openai_data = {
-        "clues": [],
-        "fun_facts": []
-    }
-    gemini_data = fetch_with_retries(get_gemini_data, city_name)
-    groq_data = fetch_with_retries(get_groq_data, city_name)
-
-    # Merge results, using any available data
-    clues = list(set(openai_data["clues"] + gemini_data["clues"] + groq_data["clues"]))
-    fun_facts = list(set(openai_data["fun_facts"] + gemini_data["fun_facts"] + groq_data["fun_facts"]))
-
-    # Fallback if all APIs fail
-    if not clues:
-        clues = [f"A famous location known as {city_name}", "A popular tourist destination"]
-    if not fun_facts:
-        fun_facts = [f"Located in a fascinating region", f"{city_name} has a rich history"]
+        return empty_result()
 
-    return Destination(name=city_name, alias=alias, clues=clues[:5], fun_facts=fun_facts[:5])
+# Function to handle API retries
+async def fetch_with_retries(provider: Provider, city_name: str, max_retries=3,
+                             cache: Optional[LLMCache] = None) -> Dict[str, List[str]]:
+    key = cache_key(provider.name, provider.model, provider.prompt(city_name), provider.temperature)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+    for attempt in range(max_retries):
+        await provider.bucket.acquire()
+        try:
+            async with provider.in_flight:
+                result = await provider.fetch(city_name)
+            # Empty results are parse failures; don't pin them in the cache
+            if cache is not None and (result["clues"] or result["fun_facts"]):
+                cache.set(key, result)
+            return result
+        except RateLimited as e:
+            # Pause the whole provider; the next acquire waits out the pause
+            delay = e.retry_after if e.retry_after is not None else 2**attempt
+            provider.bucket.pause(delay)
+            logging.warning(f"Rate limit reached for {provider.name} on attempt {attempt + 1}. Retrying in {delay} seconds...")
+            continue
+        except Exception as e:
+            delay = 2**attempt + random.random()  # Exponential backoff with jitter
+            print(f"{provider.name} API error for {city_name}: {e}. Retrying in {delay:.1f} seconds...")
+            logging.exception(f"{provider.name} API error on attempt {attempt + 1}: {e}. Retrying in {delay:.1f} seconds...")
+        await asyncio.sleep(delay)
+    print(f"Failed to fetch {provider.name} data for {city_name} after {max_retries} attempts.")
+    logging.error(f"Failed to fetch {provider.name} data for {city_name} after {max_retries} attempts.")
+    return empty_result()  # Return empty fallback
+
+# Function to generate data from all providers concurrently
+async def generate_destination_data(city_name: str, providers: List[Provider],
+                                    cache: Optional[LLMCache] = None) -> Optional[Destination]:
+    """Merge every provider's clues for a city, or return None if any provider failed.
+
+    A failed city is left for the next run rather than saved with fewer
+    clues; the responses that did succeed are cached, so only the failed
+    providers are called again.
+    """
+    results = await asyncio.gather(*(fetch_with_retries(provider, city_name, cache=cache) for provider in providers))
+    failed = [provider.name for provider, result in zip(providers, results) if not (result["clues"] or result["fun_facts"])]
+    if failed:
+        print(f"Skipping {city_name}: no data from {', '.join(failed)}")
+        return None
+
+    # Merge results in provider order, dropping near-duplicates between providers
+    clues = dedupe_texts([clue for result in results for clue in result["clues"]])
+    fun_facts = dedupe_texts([fact for result in results for fact in result["fun_facts"]])
+    if not clues or not fun_facts:
+        print(f"Skipping {city_name}: no {'clues' if not clues else 'fun facts'} from any provider")
+        return None
+
+    return Destination(name=city_name, alias=city_alias(city_name), clues=clues[:5], fun_facts=fun_facts[:5])
+
+
+def load_checkpoint(path: str) -> Set[str]:
+    """Return the cities already written to a JSONL output file.
+
+    A line cut short by a crash is dropped so appending resumes cleanly.
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "rb+") as f:
+        good = 0
+        for line in f:
+            try:
+                done.add(json.loads(line)["name"])
+            except (ValueError, KeyError, TypeError):
+                break
+            if not line.endswith(b"\n"):
+                break
+            good = f.tell()
+        if good != os.path.getsize(path):
+            print(f"Dropping a partial record at the end of {path}.")
+            f.truncate(good)
+    return done
+
+
+async def generate(city_names: Iterable[str], providers: List[Provider], output: str, concurrency: int,
+                   cache: Optional[LLMCache] = None) -> int:
+    """Generate every city not already in `output`, appending one JSON line per city as it completes"""
+    done = load_checkpoint(output)
+    queue = asyncio.Queue()
+    for city in dict.fromkeys(city_names):
+        if city not in done:
+            queue.put_nowait(city)
+    total = queue.qsize()
+    print(f"{len(done)} cities already generated, {total} to go.")
+
+    completed = 0
+    failed = 0
+    started = time.monotonic()
+    with open(output, "a") as f:
+        async def worker():
+            nonlocal completed, failed
+            while not queue.empty():
+                city = queue.get_nowait()
+                destination = await generate_destination_data(city, providers, cache)
+                if destination is None:
+                    # Not checkpointed, so the next run tries it again
+                    failed += 1
+                    continue
+                f.write(json.dumps(destination.to_dict(), ensure_ascii=False) + "\n")
+                f.flush()
+                completed += 1
+                if completed % 50 == 0 or completed + failed == total:
+                    rate = completed / (time.monotonic() - started)
+                    print(f"Generated {completed}/{total} cities ({rate:.1f}/s)")
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    if failed:
+        print(f"Warning: {failed} cities failed and were not saved; rerun to retry them.")
+    return completed
+
+
+def export_json(jsonl_path: str, json_path: str, report_path: str) -> int:
+    """Write the JSONL output as the JSON array db_populate.py reads.
+
+    Clues and fun facts shared by different destinations are listed in
+    `report_path`; run dedup.py with --drop-cross to remove them.
+    """
+    with open(jsonl_path) as f:
+        destinations = [json.loads(line) for line in f if line.strip()]
+    destinations, report = dedupe_catalog(destinations)
+    if report["cross_destination"]:
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"Warning: {len(report['cross_destination'])} clues or fun facts are shared across destinations, see {report_path}")
+    with open(json_path, "w") as f:
+        json.dump(destinations, f, indent=2, ensure_ascii=False)
+    return len(destinations)
+
+
+def read_cities(path: Optional[str]) -> List[str]:
+    if not path:
+        return cities
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def build_providers(names: List[str], offline: bool) -> List[Provider]:
+    if offline:
+        return [StandInProvider(f"standin-{name}") for name in names]
+    return [PROVIDERS[name](*PROVIDER_LIMITS[name]) for name in names]
 
 # Main function
 def main():
-    all_destinations = []
-
-    for city in cities:
-        destination = generate_destination_data(city)
-        all_destinations.append(destination.to_model_dump())
-
-        # Delay to prevent rate limiting
-        time.sleep(1)
-
-    # Save to JSON
-    with open('destinations.json', 'w') as f:
-        json.dump(all_destinations, f, indent=2)
-
-    print(f"Generated data for {len(all_destinations)} cities")
-    print("Data saved to destinations.json")
+    parser = argparse.ArgumentParser(description="Generate destination clues and fun facts with LLMs")
+    parser.add_argument("--cities", help="File with one city per line (defaults to the built-in list)")
+    parser.add_argument("--output", default="destinations.jsonl", help="JSONL output, also the resume checkpoint")
+    parser.add_argument("--json", default="destinations.json", help="JSON array written when the run finishes")
+    parser.add_argument("--providers", default="gemini,groq", help=f"Comma-separated subset of {','.join(PROVIDERS)}")
+    parser.add_argument("--concurrency", type=int, default=16, help="Cities generated at once")
+    parser.add_argument("--offline", action="store_true", help="Use stand-in providers instead of the LLM APIs")
+    parser.add_argument("--cache", default="llm_cache.sqlite3", help="Response cache file (empty to disable)")
+    parser.add_argument("--cache-max-mb", type=int, default=256, help="Evict least recently used responses past this size")
+    parser.add_argument("--refresh", action="store_true", help="Ignore cached responses and fetch everything again")
+    parser.add_argument("--dedup-report", default="dedup_report.json", help="Where near-duplicates shared across destinations are listed")
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.providers.split(",") if name.strip()]
+    unknown = [name for name in names if name not in PROVIDERS]
+    if unknown:
+        parser.error(f"Unknown providers: {', '.join(unknown)}")
+
+    async def run():
+        # Providers own asyncio primitives, so create them inside the running loop
+        providers = build_providers(names, args.offline)
+        return await generate(read_cities(args.cities), providers, args.output, args.concurrency, cache)
+
+    cache = LLMCache(args.cache, args.cache_max_mb * 1024 * 1024, args.refresh) if args.cache else None
+    started = time.monotonic()
+    try:
+        generated = asyncio.run(run())
+    finally:
+        if cache is not None:
+            cache.close()
+    print(f"Generated data for {generated} cities in {time.monotonic() - started:.1f}s")
+    if cache is not None:
+        print(f"Response cache: {cache.hits} hits, {cache.misses} misses")
+
+    if args.json:
+        count = export_json(args.output, args.json, args.dedup_report)
+        print(f"Data for {count} cities saved to {args.json}")
 
 if __name__ == "__main__":
     main()
@@ -1,7 +1,11 @@
+import argparse
 import json
+import time
 import pymongo
-from pymongo import MongoClient
-from typing import List, Dict, Any
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pymongo import MongoClient, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+from typing import List, Dict, Any, IO, Iterator
 import os
 from dotenv import load_dotenv
 
@@ -14,6 +18,9 @@ MONGO_URI = os.getenv("MONGO_DB_URI")
 DB_NAME = "destinations"  # Or your desired database name
 COLLECTION_NAME = "travel_destinations"  # Or your desired collection name
 
+READ_CHUNK_SIZE = 1 << 16  # Characters read from the input file at a time
+PROGRESS_INTERVAL_SECONDS = 5
+
 # --- Data Model (from dataset_generator.py) ---
 class Destination:
     def __init__(self, name: str, alias: str, clues: List[str], fun_facts: List[str]):
@@ -31,75 +38,192 @@ class Destination:
         }
 # --- End Data Model ---
 
-def populate_mongodb(json_file: str, mongo_uri: str, db_name: str, collection_name: str):
+def iter_json_array(f: IO[str], chunk_size: int = READ_CHUNK_SIZE) -> Iterator[Any]:
+    """Yield the items of a top-level JSON array without reading the whole file"""
+    decoder = json.JSONDecoder()
+    buffer, pos, opened = "", 0, False
+    while True:
+        # Skip whitespace, the opening bracket and separators between items
+        while pos < len(buffer) and (buffer[pos].isspace() or buffer[pos] == "," or (buffer[pos] == "[" and not opened)):
+            opened = opened or buffer[pos] == "["
+            pos += 1
+        if pos == len(buffer):
+            buffer, pos = f.read(chunk_size), 0
+            if not buffer:
+                return
+            continue
+        if not opened:
+            raise ValueError("Expected a JSON array")
+        if buffer[pos] == "]":
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # The item is cut off at the end of the buffer: read more and retry
+            more = f.read(chunk_size)
+            if not more:
+                raise
+            buffer, pos = buffer[pos:] + more, 0
+            continue
+        yield item
+        pos = end
+
+
+def iter_jsonl(f: IO[str]) -> Iterator[Any]:
+    for line in f:
+        if line.strip():
+            yield json.loads(line)
+
+
+def iter_records(f: IO[str]) -> Iterator[Any]:
+    """Yield records from either a JSON array or JSON Lines, detected from the first character"""
+    first = f.read(1)
+    while first.isspace():
+        first = f.read(1)
+    f.seek(0)
+    return iter_json_array(f) if first == "[" else iter_jsonl(f)
+
+
+def is_valid(item: Any) -> bool:
+    # Validate data format (important for type safety and preventing errors)
+    if isinstance(item, dict) and "name" in item and "alias" in item and "clues" in item and "fun_facts" in item:
+        # Basic type checking
+        if isinstance(item["name"], str) and isinstance(item["alias"], str) and \
+           isinstance(item["clues"], list) and isinstance(item["fun_facts"], list):
+            return True
+        print(f"Warning: Skipping item due to incorrect data types: {item}")
+    else:
+        print(f"Warning: Skipping item due to missing fields: {item}")
+    return False
+
+
+def reserve_ordinals(collection, count: int) -> int:
+    """Reserve `count` destination ordinals from the app's counter (see app/services/ordinals.py)"""
+    counter = collection.database["counters"].find_one_and_update(
+        {"_id": collection.name}, {"$inc": {"next_ordinal": count}}, upsert=True, return_document=ReturnDocument.AFTER
+    )
+    return counter["next_ordinal"] - count
+
+
+def upsert_batch(collection, batch: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Upsert one batch by alias in a single unordered bulk write"""
+    # Only inserted destinations take their ordinal; the rest are left unused
+    first = reserve_ordinals(collection, len(batch))
+    requests = [
+        UpdateOne(
+            {"alias": item["alias"]},
+            {"$set": {"name": item["name"], "clues": item["clues"], "fun_facts": item["fun_facts"]},
+             "$setOnInsert": {"ordinal": first + i}},
+            upsert=True,
+        )
+        for i, item in enumerate(batch)
+    ]
+    try:
+        result = collection.bulk_write(requests, ordered=False).bulk_api_result
+        errors = 0
+    except BulkWriteError as e:
+        # Unordered: everything but the failed operations was applied
+        result = e.details
+        errors = len(result.get("writeErrors", []))
+        for error in result.get("writeErrors", [])[:3]:
+            print(f"Warning: write failed for alias {batch[error['index']]['alias']}: {error.get('errmsg')}")
+    return {"upserted": result.get("nUpserted", 0), "modified": result.get("nModified", 0),
+            "matched": result.get("nMatched", 0), "errors": errors}
+
+
+def ensure_alias_index(collection):
+    # Earlier versions of this script created a plain "alias_1" index, which
+    # conflicts with the app's unique "alias_unique" index on the same key.
+    if "alias_1" in collection.index_information():
+        collection.drop_index("alias_1")
+        print("Dropped the legacy non-unique 'alias_1' index.")
+    # The upserts look documents up by alias, so make sure the index exists first
+    collection.create_index([("alias", 1)], unique=True, name="alias_unique")
+
+
+def populate_mongodb(json_file: str, mongo_uri: str, db_name: str, collection_name: str,
+                     batch_size: int = 1000, workers: int = 4):
     """
-    Populates a MongoDB database with data from a JSON file.
+    Streams destinations from a JSON array or JSON Lines file into MongoDB.
+
+    Destinations are upserted by alias, so the script can be rerun to refresh
+    or extend an existing collection in place. Records are read
+    incrementally and written in unordered batches by several threads, with
+    at most two batches per writer held in memory.
 
     Args:
-        json_file: Path to the JSON file containing the destination data.
+        json_file: Path to the JSON or JSONL file containing the destination data.
         mongo_uri: The MongoDB connection string.
         db_name: The name of the database to use.
         collection_name: The name of the collection to populate.
+        batch_size: Destinations per bulk write.
+        workers: Bulk writes in flight at once.
     """
 
+    client = None
     try:
         # Connect to MongoDB
-        client = MongoClient(mongo_uri)
-        db = client[db_name]
-        collection = db[collection_name]
-
-        # Check if collection exists and is not empty
-        if collection.count_documents({}) > 0:
-            print(f"Collection '{collection_name}' already exists and is not empty. Skipping population.")
-            client.close()
-            return
-
-        # Load data from JSON file
-        with open(json_file, 'r') as f:
-            data = json.load(f)
-
-        # Validate data format (important for type safety and preventing errors)
-        validated_data = []
-        for item in data:
-            if isinstance(item, dict) and "name" in item and "alias" in item and "clues" in item and "fun_facts" in item:
-                # Basic type checking
-                if isinstance(item["name"], str) and isinstance(item["alias"], str) and \
-                   isinstance(item["clues"], list) and isinstance(item["fun_facts"], list):
-                    validated_data.append(item)
-                else:
-                    print(f"Warning: Skipping item due to incorrect data types: {item}")
-            else:
-                print(f"Warning: Skipping item due to missing fields: {item}")
-
-        if not validated_data:
-            print("No valid data found in the JSON file.")
-            client.close()
-            return
-
-        # Insert data into MongoDB
-        result = collection.insert_many(validated_data)
-        print(f"Inserted {len(result.inserted_ids)} documents into '{collection_name}'.")
-
-        # Create indexes (important for performance)
-        collection.create_index("name")  # Index on the 'name' field
-        collection.create_index("alias") # Index on the 'alias' field
-        print("Created indexes on 'name' and 'alias' fields.")
-
+        client = MongoClient(mongo_uri, maxPoolSize=workers)
+        collection = client[db_name][collection_name]
+        ensure_alias_index(collection)
+
+        totals = {"read": 0, "invalid": 0, "upserted": 0, "modified": 0, "matched": 0, "errors": 0}
+        started = last_report = time.monotonic()
+
+        def collect(done):
+            for future in done:
+                for key, value in future.result().items():
+                    totals[key] += value
+
+        with open(json_file, 'r') as f, ThreadPoolExecutor(max_workers=workers) as executor:
+            pending, batch = set(), []
+            for item in iter_records(f):
+                totals["read"] += 1
+                if not is_valid(item):
+                    totals["invalid"] += 1
+                    continue
+                batch.append(item)
+                if len(batch) < batch_size:
+                    continue
+                pending.add(executor.submit(upsert_batch, collection, batch))
+                batch = []
+                # Backpressure: stop reading while every writer has a batch queued
+                if len(pending) >= workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                if time.monotonic() - last_report >= PROGRESS_INTERVAL_SECONDS:
+                    last_report = time.monotonic()
+                    print(f"Read {totals['read']} destinations ({totals['read'] / (last_report - started):.0f}/s)")
+            if batch:
+                pending.add(executor.submit(upsert_batch, collection, batch))
+            collect(wait(pending).done)
+
+        elapsed = time.monotonic() - started
+        print(f"Processed {totals['read']} destinations in {elapsed:.1f}s ({totals['read'] / max(elapsed, 1e-9):.0f}/s): "
+              f"{totals['upserted']} inserted, {totals['modified']} updated, "
+              f"{totals['matched'] - totals['modified']} unchanged, {totals['invalid']} invalid, {totals['errors']} failed.")
 
     except pymongo.errors.ConnectionFailure as e:
         print(f"Could not connect to MongoDB: {e}")
     except FileNotFoundError:
         print(f"Error: JSON file not found: {json_file}")
-    except json.JSONDecodeError:
-        print(f"Error: Invalid JSON format in file: {json_file}")
+    except ValueError as e:  # Includes json.JSONDecodeError
+        print(f"Error: Invalid JSON format in file {json_file}: {e}")
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
     finally:
-        if 'client' in locals():  # Check if client was created before closing
+        if client is not None:
             client.close()
 
 
 if __name__ == "__main__":
-    # Replace 'destinations.json' with the actual path to your JSON file
-    json_filepath = 'destinations.json'
-    populate_mongodb(json_filepath, MONGO_URI, DB_NAME, COLLECTION_NAME)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Load destinations into MongoDB, updating existing ones by alias")
+    parser.add_argument("json_file", nargs="?", default="destinations.json", help="JSON array or JSON Lines file")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Destinations per bulk write")
+    parser.add_argument("--workers", type=int, default=4, help="Bulk writes in flight at once")
+    args = parser.parse_args()
+
+    if not MONGO_URI:
+        print("MONGO_DB_URI environment variable not set.")
+    else:
+        populate_mongodb(args.json_file, MONGO_URI, DB_NAME, COLLECTION_NAME, args.batch_size, args.workers)
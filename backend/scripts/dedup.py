@@ -0,0 +1,192 @@
+import argparse
+import json
+import re
+import time
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+# MinHash / LSH parameters. With 16 bands of 4 rows, pairs above ~0.5 Jaccard
+# similarity almost always share a bucket; candidates are then checked
+# against THRESHOLD using the signatures.
+SHINGLE_SIZE = 5  # Characters per shingle, after normalisation
+NUM_PERM = 64
+BANDS = 16
+THRESHOLD = 0.6
+CHUNK_SHINGLES = 1 << 18  # Bounds the (NUM_PERM x shingles) block hashed at once
+MIN_KEEP = 2  # Never drop a destination's clues or fun facts below this many
+FIELDS = ("clues", "fun_facts")
+
+_rng = np.random.default_rng(0x5EED)
+_A = _rng.integers(0, 2**63, NUM_PERM, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_B = _rng.integers(0, 2**63, NUM_PERM, dtype=np.uint64)
+_SHIFTS = np.arange(SHINGLE_SIZE, dtype=np.uint64) * np.uint64(8)
+
+
+def normalize(text: str) -> str:
+    return " ".join(re.sub(r"[^\w]+", " ", text.lower()).split())
+
+
+def shingle_hashes(texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """32-bit hashes of the character shingles of all texts, and how many belong to each text.
+
+    Texts are hashed together in one buffer; windows that straddle two texts
+    are dropped. Repeated shingles are kept since they don't change a MinHash.
+    """
+    encoded = [normalize(text).encode().ljust(SHINGLE_SIZE, b"\0") for text in texts]
+    lengths = np.fromiter((len(e) for e in encoded), dtype=np.int64, count=len(encoded))
+    data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    windows = len(data) - SHINGLE_SIZE + 1
+    packed = np.zeros(windows, dtype=np.uint64)
+    for offset in range(SHINGLE_SIZE):
+        packed |= data[offset:offset + windows].astype(np.uint64) << np.uint64(8 * offset)
+    starts = np.cumsum(lengths) - lengths
+    position = np.arange(windows) - np.repeat(starts, lengths)[:windows]
+    owner_length = np.repeat(lengths, lengths)[:windows]
+    packed = packed[position <= owner_length - SHINGLE_SIZE]
+    return (packed * np.uint64(0x9E3779B97F4A7C15)) >> np.uint64(32), lengths - SHINGLE_SIZE + 1
+
+
+def signatures(texts: Sequence[str]) -> np.ndarray:
+    """MinHash signature of every text, one row per text"""
+    hashes, counts = shingle_hashes(texts)
+    ends = np.cumsum(counts)
+    result = np.empty((len(texts), NUM_PERM), dtype=np.uint32)
+    start = 0
+    while start < len(texts):
+        # Take texts until the chunk holds CHUNK_SHINGLES shingles (at least one text)
+        first = ends[start] - counts[start]
+        end = max(start + 1, int(np.searchsorted(ends, first + CHUNK_SHINGLES, side="right")))
+        chunk = hashes[first:ends[end - 1]]
+        offsets = ends[start:end] - counts[start:end] - first
+        # Multiply-shift hashing: one universal hash per permutation
+        hashed = (_A[:, None] * chunk[None, :] + _B[:, None]) >> np.uint64(32)
+        result[start:end] = np.minimum.reduceat(hashed, offsets, axis=1).T
+        start = end
+    return result
+
+
+def _find(parent: List[int], i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def near_duplicate_groups(texts: Sequence[str], threshold: float = THRESHOLD) -> List[List[int]]:
+    """Groups of indices of near-duplicate texts, in input order.
+
+    Each LSH band buckets the signatures; every bucket member is compared
+    with the bucket's first member only, so the work grows linearly with
+    the number of texts rather than with the number of pairs.
+    """
+    if len(texts) < 2:
+        return []
+    sigs = signatures(texts)
+    rows = NUM_PERM // BANDS
+    parent = list(range(len(texts)))
+    for band in range(BANDS):
+        keys = np.ascontiguousarray(sigs[:, band * rows:(band + 1) * rows])
+        keys = keys.view(np.dtype((np.void, keys.dtype.itemsize * rows))).ravel()
+        _, first, bucket = np.unique(keys, return_index=True, return_inverse=True)
+        representative = first[bucket]
+        candidates = np.nonzero(representative != np.arange(len(texts)))[0]
+        if not len(candidates):
+            continue
+        similarity = (sigs[candidates] == sigs[representative[candidates]]).mean(axis=1)
+        for i in candidates[similarity >= threshold]:
+            a, b = _find(parent, int(i)), _find(parent, int(representative[i]))
+            if a != b:
+                parent[max(a, b)] = min(a, b)
+    groups: Dict[int, List[int]] = {}
+    for i in range(len(texts)):
+        groups.setdefault(_find(parent, i), []).append(i)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def dedupe_texts(texts: Sequence[str], threshold: float = THRESHOLD) -> List[str]:
+    """Drop near-duplicates, keeping the first text of each group"""
+    drop = {i for group in near_duplicate_groups(texts, threshold) for i in group[1:]}
+    return [text for i, text in enumerate(texts) if i not in drop]
+
+
+def dedupe_catalog(destinations: List[Dict[str, Any]], threshold: float = THRESHOLD,
+                   drop_cross: bool = False) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Deduplicate clues and fun facts across a whole catalog.
+
+    Near-duplicates within one destination are merged. Near-duplicates
+    shared by different destinations are ambiguous (the clue fits another
+    city), so they are reported, and with `drop_cross` removed from every
+    destination but the first as long as it keeps MIN_KEEP entries.
+    Returns the cleaned destinations and a report.
+    """
+    cleaned = [dict(d) for d in destinations]
+    report: Dict[str, Any] = {"merged": 0, "dropped": 0, "cross_destination": []}
+    for field in FIELDS:
+        owners = [(d, i) for d, destination in enumerate(destinations) for i in range(len(destination.get(field) or []))]
+        texts = [destinations[d][field][i] for d, i in owners]
+        drop = set()
+        remaining = [len(destination.get(field) or []) for destination in destinations]
+        for group in near_duplicate_groups(texts, threshold):
+            kept: Dict[int, int] = {}
+            for position in group:
+                d, i = owners[position]
+                if d in kept:
+                    drop.add((d, i))
+                    remaining[d] -= 1
+                    report["merged"] += 1
+                else:
+                    kept[d] = i
+            if len(kept) > 1:
+                report["cross_destination"].append({
+                    "field": field,
+                    "entries": [{"name": destinations[d]["name"], "text": destinations[d][field][i]} for d, i in kept.items()],
+                })
+                if drop_cross:
+                    for d, i in list(kept.items())[1:]:
+                        if remaining[d] > MIN_KEEP:
+                            drop.add((d, i))
+                            remaining[d] -= 1
+                            report["dropped"] += 1
+        for d, destination in enumerate(destinations):
+            values = destination.get(field) or []
+            cleaned[d][field] = [value for i, value in enumerate(values) if (d, i) not in drop]
+    return cleaned, report
+
+
+def read_destinations(path: str) -> List[Dict[str, Any]]:
+    with open(path) as f:
+        if path.endswith(".jsonl"):
+            return [json.loads(line) for line in f if line.strip()]
+        return json.load(f)
+
+
+def write_destinations(path: str, destinations: List[Dict[str, Any]]):
+    with open(path, "w") as f:
+        if path.endswith(".jsonl"):
+            for destination in destinations:
+                f.write(json.dumps(destination, ensure_ascii=False) + "\n")
+        else:
+            json.dump(destinations, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find and merge near-duplicate clues and fun facts")
+    parser.add_argument("input", help="destinations.json or a .jsonl file from dataset_generator.py")
+    parser.add_argument("--output", help="Write the deduplicated catalog here")
+    parser.add_argument("--report", default="dedup_report.json", help="Cross-destination near-duplicates")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="Estimated Jaccard similarity to treat as duplicate")
+    parser.add_argument("--drop-cross", action="store_true", help="Also drop clues shared with another destination")
+    args = parser.parse_args()
+
+    started = time.monotonic()
+    destinations = read_destinations(args.input)
+    cleaned, report = dedupe_catalog(destinations, args.threshold, args.drop_cross)
+    print(f"Checked {len(destinations)} destinations in {time.monotonic() - started:.1f}s: "
+          f"{report['merged']} near-duplicates merged, {len(report['cross_destination'])} shared across destinations, "
+          f"{report['dropped']} dropped.")
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    if args.output:
+        write_destinations(args.output, cleaned)
+        print(f"Deduplicated catalog saved to {args.output}")
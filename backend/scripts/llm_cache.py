@@ -0,0 +1,78 @@
+import hashlib
+import json
+import sqlite3
+import time
+from typing import Any, Optional
+
+
+def cache_key(provider: str, model: str, prompt: str, temperature: Optional[float]) -> str:
+    """Content address of an LLM request: any change to the request gives a new key"""
+    request = json.dumps([provider, model, prompt, temperature], ensure_ascii=False)
+    return hashlib.sha256(request.encode()).hexdigest()
+
+
+class LLMCache:
+    """Persistent cache of parsed LLM responses in a SQLite file.
+
+    Entries are keyed by `cache_key`, so rerunning the generator only pays
+    for requests whose provider, model, prompt or temperature changed. When
+    the stored responses grow past `max_bytes`, the least recently used
+    entries are evicted. With `refresh`, lookups always miss but responses
+    are still stored, replacing the old entries.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024, refresh: bool = False):
+        self.max_bytes = max_bytes
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, used_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_used_at ON responses (used_at)")
+        self._conn.commit()
+        self.size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key: str) -> Optional[Any]:
+        if self.refresh:
+            self.misses += 1
+            return None
+        row = self._conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._conn.execute("UPDATE responses SET used_at = ? WHERE key = ?", (time.time(), key))
+        self._conn.commit()
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any):
+        data = json.dumps(value, ensure_ascii=False)
+        previous = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO responses (key, value, size, used_at) VALUES (?, ?, ?, ?)",
+            (key, data, len(data), time.time()),
+        )
+        self.size += len(data) - (previous[0] if previous else 0)
+        if self.size > self.max_bytes:
+            self._evict()
+        self._conn.commit()
+
+    def _evict(self):
+        # Drop least recently used entries until the cache is back under 90% of its budget
+        target = self.max_bytes * 0.9
+        rows = self._conn.execute("SELECT key, size FROM responses ORDER BY used_at").fetchall()
+        evicted = []
+        for key, size in rows:
+            if self.size <= target:
+                break
+            evicted.append((key,))
+            self.size -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,22 @@
+import asyncio
+import os
+import sys
+
+# Run once per deploy, before starting instances with SKIP_INDEX_CREATION=true
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from app.db.database import close, create_indexes, db  # noqa: E402
+from app.services.ordinals import number_destinations  # noqa: E402
+
+
+async def migrate() -> bool:
+    try:
+        indexed = await create_indexes()
+        numbered = await number_destinations(db)
+        return indexed and numbered
+    finally:
+        close()
+
+
+if __name__ == "__main__":
+    # A failed migration must fail the deploy step
+    sys.exit(0 if asyncio.run(migrate()) else 1)
@@ -3,6 +3,7 @@
 import { useState, useEffect } from "react";
 import { useRouter } from "next/navigation";
 import GameBoard from "../../../components/GameBoard";
+import LiveChallenge from "../../../components/LiveChallenge";
 import useUser from "../../../hooks/useUser";
 import Image from "next/image";
 import { use } from "react";
@@ -22,6 +23,7 @@ export default function ChallengePage({
   } | null>(null);
   const [isLoadingChallenge, setIsLoadingChallenge] = useState(true);
   const [challengeError, setChallengeError] = useState<string | null>(null);
+  const [playLive, setPlayLive] = useState(false);
 
   useEffect(() => {
     const challengeId = resolvedParams.code;
@@ -161,9 +163,22 @@ export default function ChallengePage({
             </svg>
             <span>Beat their score to win the challenge!</span>
           </div>
+          <button
+            onClick={() => setPlayLive(!playLive)}
+            className="mt-4 px-4 py-2 bg-white/20 hover:bg-white/30 rounded-lg font-medium transition"
+          >
+            {playLive ? "Play on my own" : "Play head-to-head live"}
+          </button>
         </div>
 
-        <GameBoard username={user.username} challengeMode={true} />
+        {playLive ? (
+          <LiveChallenge
+            challengeCode={resolvedParams.code}
+            username={user.username}
+          />
+        ) : (
+          <GameBoard username={user.username} challengeMode={true} />
+        )}
       </div>
     </div>
   );
@@ -0,0 +1,123 @@
+"use client";
+
+import { useState } from "react";
+import Clue from "./Clue";
+import AnswerOptions from "./AnswerOptions";
+import useChallengeRoom from "../hooks/useChallengeRoom";
+
+interface LiveChallengeProps {
+  challengeCode: string;
+  username: string;
+}
+
+export default function LiveChallenge({
+  challengeCode,
+  username,
+}: LiveChallengeProps) {
+  const { status, rounds, players, results, finalResult, error, answer } =
+    useChallengeRoom(challengeCode, username);
+  const [current, setCurrent] = useState(0);
+
+  const round = rounds[current];
+  const result = results[current];
+  const opponents = Object.values(players).filter(
+    (p) => p.username !== username
+  );
+  const me = players[username];
+
+  return (
+    <div className="bg-white rounded-xl shadow-lg p-6">
+      <div className="flex justify-between items-center mb-6">
+        {[me, ...opponents].map(
+          (player) =>
+            player && (
+              <div key={player.username} className="text-center">
+                <p className="font-semibold text-gray-800">
+                  {player.username}
+                  {!player.connected && (
+                    <span className="text-gray-400"> (away)</span>
+                  )}
+                </p>
+                <p className="text-2xl font-bold text-purple-600">
+                  {player.score}
+                </p>
+                <p className="text-sm text-gray-500">
+                  {player.answered}/{rounds.length} answered
+                </p>
+              </div>
+            )
+        )}
+      </div>
+
+      {error && <p className="text-red-600 mb-4">{error}</p>}
+
+      {status === "connecting" && (
+        <p className="text-gray-600">Joining the room...</p>
+      )}
+      {status === "waiting" && (
+        <p className="text-gray-600">Waiting for your opponent to join...</p>
+      )}
+      {status === "closed" && (
+        <p className="text-gray-600">The room was closed.</p>
+      )}
+
+      {status === "finished" && finalResult && (
+        <div className="text-center">
+          <h2 className="text-2xl font-bold text-gray-800 mb-2">
+            {finalResult.winner
+              ? finalResult.winner === username
+                ? "You won!"
+                : `${finalResult.winner} won!`
+              : finalResult.completed
+              ? "It's a tie!"
+              : "The game ended early"}
+          </h2>
+          <p className="text-gray-600">
+            {Object.entries(finalResult.results)
+              .map(([name, score]) => `${name}: ${score}`)
+              .join(" · ")}
+          </p>
+        </div>
+      )}
+
+      {status === "playing" && round && (
+        <div>
+          <p className="text-sm text-gray-500 mb-2">
+            Round {current + 1} of {rounds.length}
+          </p>
+          <Clue clues={round.clues} />
+          <AnswerOptions
+            options={round.options}
+            disabled={!!result}
+            selectedAnswer={result ? result.correct_answer : null}
+            onSelect={(choice) => answer(current, choice)}
+          />
+          {result && (
+            <div className="mt-6">
+              <p
+                className={`font-bold ${
+                  result.correct ? "text-green-600" : "text-red-600"
+                }`}
+              >
+                {result.correct
+                  ? `Correct! +${result.points_earned}`
+                  : `It was ${result.correct_answer}`}
+              </p>
+              {result.fun_fact && (
+                <p className="text-gray-600 mt-2">{result.fun_fact}</p>
+              )}
+              {current + 1 < rounds.length && (
+                <button
+                  onClick={() => setCurrent(current + 1)}
+                  className="mt-4 px-6 py-3 bg-purple-600 hover:bg-purple-700 text-white font-bold rounded-lg transition"
+                >
+                  Next round
+                </button>
+              )}
+            </div>
+          )}
+        </div>
+      )}
+    </div>
+  );
+}
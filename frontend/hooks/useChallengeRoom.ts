@@ -0,0 +1,126 @@
+import { useState, useEffect, useCallback, useRef } from "react";
+import {
+  LiveAnswerResult,
+  LivePlayer,
+  LiveRoomResult,
+  LiveRoomStatus,
+  LiveRound,
+} from "../lib/types";
+import { challengeAPI } from "../lib/api";
+
+/**
+ * Joins the live room of a challenge. Both players get the same rounds and
+ * the server pushes every join, answer and score, so nothing is polled.
+ */
+export default function useChallengeRoom(
+  challengeCode: string,
+  username: string,
+  enabled = true
+) {
+  const [status, setStatus] = useState<LiveRoomStatus>("connecting");
+  const [rounds, setRounds] = useState<LiveRound[]>([]);
+  const [players, setPlayers] = useState<Record<string, LivePlayer>>({});
+  const [results, setResults] = useState<Record<number, LiveAnswerResult>>({});
+  const [finalResult, setFinalResult] = useState<LiveRoomResult | null>(null);
+  const [error, setError] = useState<string | null>(null);
+  const socket = useRef<WebSocket | null>(null);
+
+  useEffect(() => {
+    if (!enabled || !challengeCode || !username) return;
+
+    const ws = new WebSocket(challengeAPI.liveURL(challengeCode, username));
+    socket.current = ws;
+
+    ws.onmessage = (event) => {
+      const message = JSON.parse(event.data);
+      switch (message.type) {
+        case "state":
+          setStatus(message.status);
+          setRounds(message.rounds);
+          setPlayers(
+            Object.fromEntries(
+              message.players.map((p: LivePlayer) => [p.username, p])
+            )
+          );
+          break;
+        case "joined":
+          setPlayers((prev) => ({
+            ...prev,
+            [message.username]: {
+              username: message.username,
+              score: 0,
+              correct: 0,
+              incorrect: 0,
+              answered: 0,
+              connected: true,
+              ...prev[message.username],
+            },
+          }));
+          break;
+        case "left":
+          setPlayers((prev) =>
+            prev[message.username]
+              ? {
+                  ...prev,
+                  [message.username]: {
+                    ...prev[message.username],
+                    connected: false,
+                  },
+                }
+              : prev
+          );
+          break;
+        case "start":
+          setStatus("playing");
+          break;
+        case "answered":
+          setPlayers((prev) => {
+            const player = prev[message.username];
+            if (!player) return prev;
+            return {
+              ...prev,
+              [message.username]: {
+                ...player,
+                connected: true,
+                score: message.score,
+                answered: message.answered,
+                correct: player.correct + (message.correct ? 1 : 0),
+                incorrect: player.incorrect + (message.correct ? 0 : 1),
+              },
+            };
+          });
+          break;
+        case "result":
+          setResults((prev) => ({ ...prev, [message.round]: message }));
+          break;
+        case "finished":
+          setStatus("finished");
+          setFinalResult(message);
+          break;
+        case "error":
+          setError(message.detail);
+          break;
+      }
+    };
+
+    ws.onclose = (event) => {
+      // Codes 4xxx carry the reason the server refused or ended the room
+      if (event.code >= 4000) setError(event.reason);
+      setStatus((prev) => (prev === "finished" ? prev : "closed"));
+    };
+
+    return () => {
+      ws.close();
+      socket.current = null;
+    };
+  }, [challengeCode, username, enabled]);
+
+  const answer = useCallback((round: number, choice: string) => {
+    setError(null);
+    socket.current?.send(
+      JSON.stringify({ type: "answer", round, answer: choice })
+    );
+  }, []);
+
+  return { status, rounds, players, results, finalResult, error, answer };
+}
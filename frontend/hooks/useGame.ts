@@ -1,7 +1,10 @@
-import { useState, useCallback } from "react";
+import { useState, useCallback, useRef } from "react";
 import { GameDestination, GameResult, Score } from "../lib/types";
 import { gameAPI } from "../lib/api";
 
+// Number of rounds fetched per request; the session is played from this queue
+const ROUND_BATCH_SIZE = 10;
+
 export default function useGame(username: string, initialScore?: Score) {
   const [destination, setDestination] = useState<GameDestination | null>(null);
   const [options, setOptions] = useState<Array<string | { name: string }>>([]);
@@ -11,11 +14,21 @@ export default function useGame(username: string, initialScore?: Score) {
   const [score, setScore] = useState<Score>(
     initialScore || { total: 0, correct: 0, incorrect: 0 }
   );
+  const roundQueue = useRef<GameDestination[]>([]);
 
   const fetchDestination = useCallback(async () => {
     setIsLoading(true);
     try {
-      const data = await gameAPI.getRandomDestination(username);
+      if (roundQueue.current.length === 0) {
+        roundQueue.current = await gameAPI.getRounds(
+          username,
+          ROUND_BATCH_SIZE
+        );
+      }
+      const data = roundQueue.current.shift();
+      if (!data) {
+        throw new Error("No rounds available");
+      }
       setDestination(data);
       setOptions(data.options);
     } catch (error) {
@@ -65,7 +78,8 @@ export default function useGame(username: string, initialScore?: Score) {
         const resultData = await gameAPI.submitAnswer(
           username,
           destination.destination_id,
-          answerText
+          answerText,
+          destination.round_token
         );
         const { correct, correct_answer, fun_fact, points_earned } = resultData;
 
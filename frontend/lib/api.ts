@@ -45,7 +45,10 @@ export const userAPI = {
   //     body: JSON.stringify({ points }),
   //   }),
 
-  getLeaderboard: () => fetchAPI("/api/users/leaderboard"),
+  getLeaderboard: (offset = 0, limit = 10) =>
+    fetchAPI(`/api/users/leaderboard?offset=${offset}&limit=${limit}`),
+
+  getRank: (username: string) => fetchAPI(`/api/users/${username}/rank`),
 };
 
 /**
@@ -59,10 +62,18 @@ export const gameAPI = {
       },
     }),
 
+  getRounds: async (username: string, count: number) =>
+    fetchAPI<GameDestination[]>(`/api/destinations/rounds?n=${count}`, {
+      headers: {
+        "X-Username": username,
+      },
+    }),
+
   submitAnswer: async (
     username: string,
     destinationId: string,
-    answer: string
+    answer: string,
+    roundToken?: string
   ) =>
     fetchAPI<{
       correct: boolean;
@@ -75,6 +86,7 @@ export const gameAPI = {
         destination_id: destinationId,
         user_answer: answer,
         username,
+        round_token: roundToken,
       }),
     }),
 
@@ -104,6 +116,16 @@ export const challengeAPI = {
 
   get: (challengeId: string) => fetchAPI(`/api/challenges/${challengeId}`),
 
-  getUserChallenges: (username: string) =>
-    fetchAPI(`/api/users/${username}/challenges`),
+  // WebSocket URL of the live head-to-head room for a challenge
+  liveURL: (challengeCode: string, username: string) =>
+    `${API_BASE_URL.replace(/^http/, "ws")}/api/challenges/${challengeCode}/live?username=${encodeURIComponent(
+      username
+    )}`,
+
+  getUserChallenges: (username: string, after?: string) =>
+    fetchAPI(
+      `/api/challenges/user/${username}${
+        after ? `?after=${encodeURIComponent(after)}` : ""
+      }`
+    ),
 };
@@ -104,4 +104,38 @@ export interface GameDestination {
   alias: string;
   clues: string[];
   options: string[];
+  round_token?: string;
+}
+
+/**
+ * Live challenge room types
+ */
+export interface LivePlayer {
+  username: string;
+  score: number;
+  correct: number;
+  incorrect: number;
+  answered: number;
+  connected: boolean;
+}
+
+export interface LiveRound {
+  clues: string[];
+  options: string[];
+}
+
+export type LiveRoomStatus = "connecting" | "waiting" | "playing" | "finished" | "closed";
+
+export interface LiveAnswerResult {
+  round: number;
+  correct: boolean;
+  correct_answer: string;
+  fun_fact: string;
+  points_earned: number;
+}
+
+export interface LiveRoomResult {
+  completed: boolean;
+  results: Record<string, number>;
+  winner: string | null;
 }